@@ -1,13 +1,30 @@
+import argparse
+import copy
+import functools
+import hashlib
+import heapq
 import math
 import random
+from array import array
 import sys
+import tempfile
+import threading
+import time
 import json
 import sqlite3
 import os
+import pickle
 import re
+import weakref
+from typing import NamedTuple
 from mcp.server.fastmcp import FastMCP
 from level_up import apply_level_up, CASTER_TYPE_MAP, SLOT_TABLES, FULL_CASTER_SPELL_SLOTS, WARLOCK_SPELL_SLOTS
 
+try:
+    from forge.class_spells import CLASS_CANTRIPS, LEVEL_1_SPELLS
+except ImportError:
+    CLASS_CANTRIPS, LEVEL_1_SPELLS = {}, {}
+
 try:
     import yaml
 except ImportError:
@@ -16,8 +33,8 @@ except ImportError:
 mcp = FastMCP("InfinityRolls", log_level="WARNING")
 
 DB_CONNECTION = None
-
-_COMBAT_REGISTRY: dict[str, dict] = {}
+PLAYER_FILE_PATH = None
+SESSION_DB_PATH = None
 
 XP_THRESHOLDS = [
     (2, 300), (3, 900), (4, 2700), (5, 6500),
@@ -43,29 +60,268 @@ CR_XP_TABLE = {
 }
 
 
-_SPELLS_DB = None
+_SPELL_CATALOG = None
+_SPELLS_READY = threading.Event()
+_SPELLS_LOCK = threading.Lock()
+
+# config/spells.yml is compiled once into a pickled index next to it. The
+# index is reused while the YAML's mtime and size are unchanged; if only the
+# mtime moved, a content hash decides. Without a usable index the YAML is
+# parsed with the C loader when PyYAML has one.
+SPELL_INDEX_VERSION = 3
+_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config")
+SPELLS_YAML_PATH = os.path.join(_CONFIG_DIR, "spells.yml")
+SPELL_INDEX_PATH = os.path.join(_CONFIG_DIR, ".spells.idx")
+
+
+# query_spells filters: each maps a value to the set of spell keys having it.
+SPELL_QUERY_FIELDS = ("level", "school", "damage_type", "save_type", "concentration", "aoe", "ritual")
+SPELL_QUERY_COLUMNS = ["name", "level", "school", "attack_type", "damage", "damage_type", "save_type", "concentration", "ritual"]
+
+
+def _spell_query_values(spell: dict) -> dict:
+    return {
+        "level": spell.get("level", 0),
+        "school": str(spell.get("school") or "").lower(),
+        "damage_type": str(spell.get("damage_type") or "").lower(),
+        "save_type": str(spell.get("save_type") or "").lower(),
+        "concentration": bool(spell.get("requires_concentration")),
+        "aoe": bool(spell.get("aoe")),
+        "ritual": bool(spell.get("ritual")),
+    }
+
+
+def _spell_query_row(spell: dict) -> list:
+    damage = "" if spell.get("no_damage") else str(spell.get("damage_dice") or "")
+    if damage and spell.get("damage_modifier"):
+        damage += f"{spell['damage_modifier']:+d}"
+    return [spell["name"], spell.get("level", 0), spell.get("school", ""), spell.get("attack_type", ""), damage,
+            spell.get("damage_type") or "", spell.get("save_type") or "",
+            bool(spell.get("requires_concentration")), bool(spell.get("ritual"))]
+
+
+def _compile_spell_index(spells_list) -> dict:
+    spells, rows = {}, {}
+    postings = {field: {} for field in SPELL_QUERY_FIELDS}
+    for s in spells_list or []:
+        key = s["name"].lower()
+        spells[key] = s
+        rows[key] = _spell_query_row(s)
+        for field, value in _spell_query_values(s).items():
+            postings[field].setdefault(value, set()).add(key)
+    order = sorted(spells, key=lambda k: (spells[k].get("level", 0), k))
+    return {"spells": spells, "postings": postings, "order": order, "rows": rows, "names": _build_name_index(spells)}
+
+
+CLASS_SPELL_MAX_LEVEL = 1  # the World Forge class lists stop at 1st level
+
+
+def _class_postings(spells: dict) -> dict:
+    """Class name -> spell keys, from the World Forge class lists (cantrips and 1st level)."""
+    by_class = {}
+    for lists in (CLASS_CANTRIPS, LEVEL_1_SPELLS):
+        for class_name, names in lists.items():
+            keys = by_class.setdefault(class_name.lower(), set())
+            keys.update(n.lower() for n in names if n.lower() in spells)
+    return by_class
+
+
+def build_spell_index(config_path: str = SPELLS_YAML_PATH, index_path: str = SPELL_INDEX_PATH) -> dict:
+    """Parse spells.yml and write the binary index; returns the index even if it cannot be written."""
+    st, raw = _read_config(config_path)
+    index = _compile_spell_index(yaml.load(raw, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)))
+    _write_config_index(index_path, st, index, hashlib.sha256(raw).hexdigest(), SPELL_INDEX_VERSION)
+    return index
+
+
+def _read_config(config_path: str) -> tuple:
+    """(stat, bytes) of a config file. The stat is taken first, so an edit saved during the read leaves the
+    index stamped older than the file and it is rebuilt on the next load instead of served stale."""
+    st = os.stat(config_path)
+    with open(config_path, "rb") as f:
+        return st, f.read()
+
+
+def _write_config_index(index_path: str, st: os.stat_result, index: dict, digest: str, version: int):
+    payload = {"version": version, "mtime_ns": st.st_mtime_ns, "size": st.st_size,
+               "sha256": digest, "index": index}
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), prefix=os.path.basename(index_path) + ".")
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, index_path)
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def _read_config_index(config_path: str, index_path: str, version: int) -> dict | None:
+    try:
+        with open(index_path, "rb") as f:
+            payload = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(payload, dict) or payload.get("version") != version or not isinstance(payload.get("index"), dict):
+        return None
+    st = os.stat(config_path)
+    if payload.get("mtime_ns") == st.st_mtime_ns and payload.get("size") == st.st_size:
+        return payload["index"]
+    st, raw = _read_config(config_path)
+    digest = hashlib.sha256(raw).hexdigest()
+    if digest != payload.get("sha256"):
+        return None
+    _write_config_index(index_path, st, payload["index"], digest, version)
+    return payload["index"]
+
+
+class _SpellCatalog(NamedTuple):
+    """One immutable generation of the spell database; a tool call reads a single generation throughout."""
+    spells: dict
+    indexes: dict
+    plans: dict
+    stamp: tuple | None = None
+
+
+def _file_stamp(path: str) -> tuple | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_spells() -> _SpellCatalog:
+    stamp = _file_stamp(SPELLS_YAML_PATH)
+    if stamp is None:
+        return _SpellCatalog({}, {}, {})
+    index = _read_config_index(SPELLS_YAML_PATH, SPELL_INDEX_PATH, SPELL_INDEX_VERSION)
+    if index is None:
+        if yaml is None:
+            return _SpellCatalog({}, {}, {}, stamp)
+        index = build_spell_index(SPELLS_YAML_PATH, SPELL_INDEX_PATH)
+    plans = {key: _compile_spell_plan(spell) for key, spell in index["spells"].items()}
+    indexes = {k: v for k, v in index.items() if k != "spells"}
+    indexes["postings"] = dict(indexes["postings"], **{"class": _class_postings(index["spells"])})
+    return _SpellCatalog(index["spells"], indexes, plans, stamp)
+
+
+def _spell_catalog() -> _SpellCatalog:
+    """Return the current spell catalog, waiting for the background warm-up if it is still loading."""
+    global _SPELL_CATALOG
+    if _SPELLS_READY.is_set():
+        return _SPELL_CATALOG
+    with _SPELLS_LOCK:
+        if not _SPELLS_READY.is_set():
+            _SPELL_CATALOG = _read_spells()
+            _SPELLS_READY.set()
+    return _SPELL_CATALOG
 
 
 def _load_spells() -> dict:
-    global _SPELLS_DB
-    if _SPELLS_DB is not None:
-        return _SPELLS_DB
-    if yaml is None:
-        _SPELLS_DB = {}
-        return _SPELLS_DB
-    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config", "spells.yml")
-    if not os.path.exists(config_path):
-        _SPELLS_DB = {}
-        return _SPELLS_DB
-    with open(config_path, "r", encoding="utf-8") as f:
-        spells_list = yaml.safe_load(f)
-    if spells_list is None:
-        _SPELLS_DB = {}
-    else:
-        _SPELLS_DB = {}
-        for s in spells_list:
-            _SPELLS_DB[s["name"].lower()] = s
-    return _SPELLS_DB
+    """Return the spell database, waiting for the background warm-up if it is still loading."""
+    return _spell_catalog().spells
+
+
+def _start_spell_warmup() -> threading.Thread:
+    """Load the spell database on a daemon thread so it overlaps the MCP handshake and world injection."""
+    thread = threading.Thread(target=_load_spells, name="spell-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+# Config catalogs are polled for edits while the server runs. A changed
+# spells.yml is recompiled on the watcher thread and the new catalog replaces
+# the old one in a single assignment, so live sessions pick it up on their next
+# tool call without a restart. A file that fails to parse (e.g. caught
+# mid-save) leaves the current catalog in place until it changes again.
+CATALOG_POLL_INTERVAL = 2.0
+_CATALOG_FAILED_STAMP = None
+
+
+def reload_spell_catalog(force: bool = False) -> bool:
+    """Recompile spells.yml if it changed since the current catalog was built; True if a new catalog was swapped in."""
+    global _SPELL_CATALOG, _CATALOG_FAILED_STAMP
+    if not _SPELLS_READY.is_set():
+        return False
+    stamp = _file_stamp(SPELLS_YAML_PATH)
+    if not force and (stamp == _SPELL_CATALOG.stamp or stamp == _CATALOG_FAILED_STAMP):
+        return False
+    try:
+        catalog = _read_spells()
+    except Exception as e:
+        _CATALOG_FAILED_STAMP = stamp
+        print(f"Spell catalog reload failed, keeping the previous one: {e}", file=sys.stderr)
+        return False
+    with _SPELLS_LOCK:
+        _SPELL_CATALOG = catalog
+    _CATALOG_FAILED_STAMP = None
+    print(f"Spell catalog reloaded ({len(catalog.spells)} spells).", file=sys.stderr)
+    return True
+
+
+def _start_catalog_watcher(interval: float = CATALOG_POLL_INTERVAL) -> threading.Thread:
+    def watch():
+        while True:
+            time.sleep(interval)
+            reload_spell_catalog()
+
+    thread = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+    thread.start()
+    return thread
+
+
+# config/monsters.yml holds SRD stat blocks for register_combatants templates
+# and is compiled into its own pickled index the same way as spells.yml. It is
+# only read at registration, so it loads on first use and is recompiled there
+# whenever the YAML's stamp moves; a file that fails to parse keeps the
+# previous catalog.
+MONSTER_INDEX_VERSION = 1
+MONSTERS_YAML_PATH = os.path.join(_CONFIG_DIR, "monsters.yml")
+MONSTER_INDEX_PATH = os.path.join(_CONFIG_DIR, ".monsters.idx")
+MONSTER_TEMPLATE_FIELDS = ("hp", "ac", "initiative_modifier", "challenge_rating", "save_modifier")
+MONSTER_TEMPLATE_MAX_COUNT = 100  # larger bodies register as one troop group ("troops": N)
+_MONSTER_CATALOG = None
+_MONSTERS_LOCK = threading.Lock()
+
+
+def _compile_monster_index(monsters_list) -> dict:
+    monsters = {m["name"].lower(): m for m in monsters_list or []}
+    return {"monsters": monsters, "names": _build_name_index(monsters)}
+
+
+def build_monster_index(config_path: str = MONSTERS_YAML_PATH, index_path: str = MONSTER_INDEX_PATH) -> dict:
+    """Parse monsters.yml and write the binary index; returns the index even if it cannot be written."""
+    st, raw = _read_config(config_path)
+    index = _compile_monster_index(yaml.load(raw, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)))
+    _write_config_index(index_path, st, index, hashlib.sha256(raw).hexdigest(), MONSTER_INDEX_VERSION)
+    return index
+
+
+def _monster_catalog() -> dict:
+    """Return the monster index {"monsters": key -> stat block, "names": trigram index}."""
+    global _MONSTER_CATALOG
+    stamp = _file_stamp(MONSTERS_YAML_PATH)
+    current = _MONSTER_CATALOG
+    if current is not None and current[0] == stamp:
+        return current[1]
+    with _MONSTERS_LOCK:
+        if _MONSTER_CATALOG is not None and _MONSTER_CATALOG[0] == stamp:
+            return _MONSTER_CATALOG[1]
+        index = {"monsters": {}, "names": None}
+        if stamp is not None:
+            try:
+                index = (_read_config_index(MONSTERS_YAML_PATH, MONSTER_INDEX_PATH, MONSTER_INDEX_VERSION)
+                         or (build_monster_index() if yaml is not None else index))
+            except Exception as e:
+                print(f"Monster catalog load failed, keeping the previous one: {e}", file=sys.stderr)
+                return _MONSTER_CATALOG[1] if _MONSTER_CATALOG is not None else index
+        _MONSTER_CATALOG = (stamp, index)
+    return index
 
 
 def _parse_higher_levels(hl_str: str) -> tuple | None:
@@ -135,36 +391,458 @@ def _compute_spell_damage(spell: dict, character_level: int, slot_level: int | N
     return dice_str, modifier, extra_dice_str
 
 
+def _spell_beams(spell: dict, character_level: int, slot_level: int | None) -> int:
+    """Separate attack rolls a multi_hit spell makes: cantrips gain beams at 5/11/17, leveled spells per slot above."""
+    if spell.get("cantrip_scaling"):
+        return 1 + sum(character_level >= tier for tier in (5, 11, 17))
+    beams = spell.get("beams", 1)
+    if slot_level is not None and slot_level > spell.get("level", 0):
+        beams += slot_level - spell.get("level", 0)
+    return beams
+
+
 def _multiply_dice_notation(dice_str: str, multiplier: int) -> str:
     if multiplier <= 1:
         return dice_str
-    parts = dice_str.lower().split("d")
-    if len(parts) != 2:
-        return dice_str
-    try:
-        num = int(parts[0]) if parts[0] else 1
-        size = int(parts[1])
-        return f"{num * multiplier}d{size}"
-    except (ValueError, TypeError):
+    expr = _compile_dice(dice_str)
+    if expr is None or not expr.terms:
         return dice_str
+    terms = tuple(t._replace(count=t.count * multiplier) for t in expr.terms)
+    return _render_dice(expr._replace(terms=terms))
 
 
 def _combine_dice(d1: str, d2: str) -> str:
     if not d2:
         return d1
-    p1 = d1.lower().split("d")
-    p2 = d2.lower().split("d")
-    if len(p1) == 2 and len(p2) == 2:
-        try:
-            n1 = int(p1[0]) if p1[0] else 1
-            s1 = int(p1[1])
-            n2 = int(p2[0]) if p2[0] else 1
-            s2 = int(p2[1])
-            if s1 == s2:
-                return f"{n1 + n2}d{s1}"
-        except (ValueError, TypeError):
-            pass
-    return f"{d1}+{d2}"
+    e1 = _compile_dice(d1)
+    e2 = _compile_dice(d2)
+    if e1 is None or e2 is None:
+        return f"{d1}+{d2}"
+    terms = list(e1.terms)
+    for t2 in e2.terms:
+        for i, t1 in enumerate(terms):
+            if t1._replace(count=0) == t2._replace(count=0) and t1.keep is None:
+                terms[i] = t1._replace(count=t1.count + t2.count)
+                break
+        else:
+            terms.append(t2)
+    return _render_dice(_DiceExpr(tuple(terms), e1.flat + e2.flat))
+
+
+# Every spell in the database is compiled once, at load, into a resolution plan:
+# its resolve_magic category and the final (dice, modifier, extra_dice) for each
+# caster level 1-20 (scaling cantrips) or slot level up to 9 (upcastable spells),
+# so a cast is a table lookup instead of higher_levels parsing and dice surgery.
+MAX_CASTER_LEVEL = 20
+MAX_SLOT_LEVEL = 9
+
+
+class _SpellPlan(NamedTuple):
+    category: str
+    scaling: str
+    damage: tuple
+
+
+def _spell_category(attack_type: str, healing: bool, hp_pool: bool, no_damage: bool, buffs: dict | None) -> str:
+    """attack, save, heal, hp_pool, buff, thp or automatic — the resolve_magic path a spell takes."""
+    if attack_type == "attack_roll":
+        return "attack"
+    if attack_type == "saving_throw":
+        return "save"
+    if healing:
+        return "heal"
+    if hp_pool:
+        return "hp_pool"
+    if no_damage:
+        return "thp" if buffs and "hp_temporary" in buffs else "buff"
+    return "automatic"
+
+
+def _spell_damage_entry(spell: dict, character_level: int, slot_level: int | None) -> tuple:
+    """_compute_spell_damage with any flat part of the dice moved into the modifier."""
+    dice, modifier, extra_dice = _compute_spell_damage(spell, character_level, slot_level)
+    expr = _compile_dice(dice)
+    if expr is not None and expr.terms and expr.flat:
+        modifier += expr.flat
+        dice = _render_dice(expr._replace(flat=0))
+    return dice, modifier, extra_dice
+
+
+def _compile_spell_plan(spell: dict) -> _SpellPlan:
+    category = _spell_category(
+        spell.get("attack_type", "attack_roll"), spell.get("healing", False), spell.get("hp_pool", False),
+        spell.get("no_damage", False), spell.get("buffs"),
+    )
+    level = spell.get("level", 0)
+    if level == 0 and spell.get("cantrip_scaling") and spell.get("cantrip_scale_dice"):
+        damage = tuple(_spell_damage_entry(spell, cl, None) for cl in range(MAX_CASTER_LEVEL + 1))
+        return _SpellPlan(category, "caster", damage)
+    if level > 0 and not spell.get("cantrip_scaling") and (spell.get("higher_levels") or spell.get("extra_higher_levels")):
+        base = _spell_damage_entry(spell, 1, level)
+        damage = tuple(base if sl <= level else _spell_damage_entry(spell, 1, sl) for sl in range(MAX_SLOT_LEVEL + 1))
+        return _SpellPlan(category, "slot", damage)
+    return _SpellPlan(category, "fixed", (_spell_damage_entry(spell, 1, None),))
+
+
+def _planned_spell_damage(plan: _SpellPlan, spell: dict, character_level: int, slot_level: int | None) -> tuple:
+    """Look up a cast in the spell's plan; slot levels outside the table are computed directly."""
+    if plan.scaling == "caster":
+        return plan.damage[min(max(character_level, 1), MAX_CASTER_LEVEL)]
+    if plan.scaling == "slot":
+        if slot_level is None:
+            return plan.damage[0]
+        if 0 <= slot_level <= MAX_SLOT_LEVEL:
+            return plan.damage[slot_level]
+        return _spell_damage_entry(spell, character_level, slot_level)
+    return plan.damage[0]
+
+
+# Near-miss names ("Fire ball", "Cure wound", "magic-missile", "goblin 1") are
+# matched on a trigram index of normalized names (lowercase, letters and digits
+# only). A match is taken automatically only when it is clearly the best one
+# and has the same numbers; otherwise the caller gets ranked suggestions.
+FUZZY_MATCH_THRESHOLD = 0.5
+FUZZY_MATCH_MARGIN = 0.15
+FUZZY_SUGGEST_THRESHOLD = 0.3
+FUZZY_SUGGESTIONS = 5
+
+
+def _normalize_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+def _name_trigrams(normalized: str) -> set:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _build_name_index(names) -> dict:
+    """Trigram index over `names`: {"exact": norm -> name, "grams": trigram -> [norm], "sizes": norm -> trigram count}."""
+    exact, grams, sizes = {}, {}, {}
+    for name in names:
+        norm = _normalize_name(name)
+        if not norm or norm in exact:
+            continue
+        exact[norm] = name
+        trigrams = _name_trigrams(norm)
+        sizes[norm] = len(trigrams)
+        for gram in trigrams:
+            grams.setdefault(gram, []).append(norm)
+    return {"exact": exact, "grams": grams, "sizes": sizes}
+
+
+def _match_name(index: dict, query: str) -> tuple[str | None, list]:
+    """Returns (name, []) for an exact or unambiguous near match, else (None, ranked suggestions)."""
+    norm = _normalize_name(query)
+    if not norm or not index:
+        return None, []
+    if norm in index["exact"]:
+        return index["exact"][norm], []
+    trigrams = _name_trigrams(norm)
+    shared = {}
+    for gram in trigrams:
+        for candidate in index["grams"].get(gram, ()):
+            shared[candidate] = shared.get(candidate, 0) + 1
+    scored = sorted(
+        ((n / (len(trigrams) + index["sizes"][c] - n), c) for c, n in shared.items()),
+        key=lambda sc: (-sc[0], sc[1]),
+    )
+    scored = [(score, c) for score, c in scored if score >= FUZZY_SUGGEST_THRESHOLD]
+    if not scored:
+        return None, []
+    best_score, best = scored[0]
+    runner_up = scored[1][0] if len(scored) > 1 else 0.0
+    if (best_score >= FUZZY_MATCH_THRESHOLD and best_score - runner_up >= FUZZY_MATCH_MARGIN
+            and re.findall(r"\d+", norm) == re.findall(r"\d+", best)):
+        return index["exact"][best], []
+    return None, [index["exact"][c] for _, c in scored[:FUZZY_SUGGESTIONS]]
+
+
+# ── COMBAT REGISTRY ──
+# Combatants are compact __slots__ records held by name. Lookups go through a
+# normalized-name index (case, spacing and punctuation ignored) that also holds
+# any aliases, so "goblin 1", "Goblin 1" and "the captain" all reach the same
+# record in one dict probe. The registry serializes to plain dicts for the
+# journal and undo.
+#
+# The registry also owns the turn order: the initiative order, the round
+# counter, a pointer to the current combatant, and a heap of timed effects
+# keyed by the (round, turn) at which they end. A duration of N rounds ends at
+# the start of the caster's turn N rounds on, and next_turn lapses everything
+# due as it moves the pointer.
+#
+# Mass combat registers identical troops as one group: a single stat line, one
+# initiative roll, and every troop's HP in one array. Area spells resolve a
+# group's saves and damage over the whole array at once and report the group
+# in aggregate; a single attack on a group hits its first troop still standing.
+
+_COMBATANT_FIELDS = (
+    "current_hp", "max_hp", "ac", "save_modifier", "challenge_rating", "initiative_modifier",
+    "initiative_roll", "initiative_total", "is_player", "killed", "conditions",
+)
+
+_DURATION_RE = re.compile(r"(\d+)\s*(round|minute|hour)", re.IGNORECASE)
+_ROUNDS_PER_UNIT = {"round": 1, "minute": 10, "hour": 600}
+
+
+def _duration_rounds(duration: str | None) -> int | None:
+    """'1 round' -> 1, 'Concentration, up to 1 minute' -> 10; None for instantaneous or open-ended durations."""
+    match = _DURATION_RE.search(duration or "")
+    if not match:
+        return None
+    return int(match.group(1)) * _ROUNDS_PER_UNIT[match.group(2).lower()]
+
+
+class _Combatant:
+    __slots__ = ("name", "aliases") + _COMBATANT_FIELDS
+
+    def __init__(self, name: str, current_hp: int, max_hp: int, ac: int, save_modifier: int = 0,
+                 challenge_rating: float | None = None, initiative_modifier: int = 0, initiative_roll: int = 0,
+                 initiative_total: int = 0, is_player: bool = False, killed: bool = False,
+                 conditions=None, aliases=()):
+        self.name = name
+        self.current_hp = current_hp
+        self.max_hp = max_hp
+        self.ac = ac
+        self.save_modifier = save_modifier
+        self.challenge_rating = challenge_rating
+        self.initiative_modifier = initiative_modifier
+        self.initiative_roll = initiative_roll
+        self.initiative_total = initiative_total
+        self.is_player = is_player
+        self.killed = killed
+        self.conditions = list(conditions or [])
+        self.aliases = tuple(aliases)
+
+    def to_dict(self) -> dict:
+        data = {field: getattr(self, field) for field in _COMBATANT_FIELDS}
+        data["conditions"] = list(self.conditions)
+        data["aliases"] = list(self.aliases)
+        return data
+
+
+class _TroopGroup:
+    __slots__ = ("name", "troop_hp", "ac", "save_modifier", "challenge_rating", "initiative_modifier",
+                 "initiative_roll", "initiative_total", "conditions", "hp", "affected")
+    is_player = False
+
+    def __init__(self, name: str, count: int = 0, troop_hp: int = 1, ac: int = 10, save_modifier: int = 0,
+                 challenge_rating: float | None = None, initiative_modifier: int = 0, initiative_roll: int = 0,
+                 initiative_total: int = 0, conditions=None, hp=None, affected=None):
+        self.name = name
+        self.troop_hp = troop_hp
+        self.ac = ac
+        self.save_modifier = save_modifier
+        self.challenge_rating = challenge_rating
+        self.initiative_modifier = initiative_modifier
+        self.initiative_roll = initiative_roll
+        self.initiative_total = initiative_total
+        self.conditions = list(conditions or [])
+        self.hp = array("l", hp if hp is not None else [troop_hp] * count)
+        # Conditions are held per group. A condition only part of the group failed its save for maps
+        # here to how many troops it stands for; conditions not listed cover the whole group.
+        self.affected = dict(affected or {})
+
+    @property
+    def count(self) -> int:
+        return len(self.hp)
+
+    @property
+    def standing(self) -> int:
+        return self.count - self.hp.count(0)
+
+    @property
+    def killed(self) -> bool:
+        return self.standing == 0
+
+    def front(self) -> int | None:
+        """Index of the first troop still standing."""
+        return next((i for i, h in enumerate(self.hp) if h > 0), None)
+
+    def to_dict(self) -> dict:
+        data = {field: getattr(self, field) for field in self.__slots__ if field != "name"}
+        data["conditions"] = list(self.conditions)
+        data["hp"] = list(self.hp)
+        data["affected"] = dict(self.affected)
+        return data
+
+    def condition_shares(self) -> dict:
+        """Condition -> "N of M" for conditions that stand for only part of the group."""
+        return {c: f"{n} of {self.standing}" for c, n in self.affected.items() if c in self.conditions}
+
+
+class _CombatRegistry:
+    def __init__(self):
+        self._entries: dict[str, _Combatant] = {}
+        self.troops: dict[str, _TroopGroup] = {}
+        self._index: dict[str, str] = {}
+        self._fuzzy = None
+        self.order: list[str] = []
+        self.round = 0
+        self.turn = 0
+        self.effects: list = []
+        self._effect_seq = 0
+        self.round_marks: list = []
+
+    def __len__(self) -> int:
+        return len(self._entries) + len(self.troops)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, name) -> bool:
+        return self.member(name) is not None
+
+    def values(self):
+        return self._entries.values()
+
+    def add(self, combatant: _Combatant):
+        """Insert or replace a combatant; its name and aliases become lookup keys."""
+        previous = self._entries.pop(combatant.name, None)
+        if previous is not None:
+            self._unindex(previous)
+        self._entries[combatant.name] = combatant
+        for key in (combatant.name,) + combatant.aliases:
+            self._index.setdefault(_normalize_name(key), combatant.name)
+        if combatant.name not in self.order:
+            self.order.append(combatant.name)
+        self._fuzzy = None
+
+    def add_troops(self, group: _TroopGroup):
+        self.troops[group.name] = group
+        self._index.setdefault(_normalize_name(group.name), group.name)
+        if group.name not in self.order:
+            self.order.append(group.name)
+        self._fuzzy = None
+
+    def _unindex(self, combatant: _Combatant):
+        for key in (combatant.name,) + combatant.aliases:
+            if self._index.get(_normalize_name(key)) == combatant.name:
+                del self._index[_normalize_name(key)]
+
+    def lookup(self, name) -> _Combatant | None:
+        if not name:
+            return None
+        entry = self._entries.get(name)
+        if entry is None:
+            canonical = self._index.get(_normalize_name(name))
+            entry = self._entries.get(canonical) if canonical else None
+        return entry
+
+    def troop(self, name) -> _TroopGroup | None:
+        if not name or not self.troops:
+            return None
+        group = self.troops.get(name)
+        if group is None:
+            group = self.troops.get(self._index.get(_normalize_name(name)))
+        return group
+
+    def member(self, name) -> _Combatant | _TroopGroup | None:
+        """A combatant or troop group by name; both take turns in the initiative order."""
+        return self.lookup(name) or self.troop(name)
+
+    def fuzzy_index(self) -> dict:
+        if self._fuzzy is None:
+            self._fuzzy = _build_name_index(list(self._entries) + list(self.troops))
+        return self._fuzzy
+
+    def start(self, order: list[str]):
+        """Begin round 1 at the top of the given initiative order."""
+        self.order = [name for name in order if name in self._entries or name in self.troops]
+        self.round, self.turn = 1, 0
+        self.effects.clear()
+
+    def current(self) -> _Combatant | _TroopGroup | None:
+        if not self.round or not self.order:
+            return None
+        name = self.order[self.turn]
+        return self._entries.get(name) or self.troops.get(name)
+
+    def advance(self) -> _Combatant | None:
+        """Move to the next combatant still in the fight, starting a new round after the last one."""
+        if not self.order:
+            return None
+        if not self.round:
+            self.round, self.turn = 1, 0
+        else:
+            self._step()
+        for _ in range(len(self.order) - 1):
+            entry = self._entries.get(self.order[self.turn]) or self.troops.get(self.order[self.turn])
+            if entry is not None and (entry.is_player or not entry.killed):
+                break
+            self._step()
+        return self.current()
+
+    def _step(self):
+        self.turn += 1
+        if self.turn >= len(self.order):
+            self.round, self.turn = self.round + 1, 0
+
+    def schedule(self, target: str, effect: str, rounds: int, caster: str | None, kind: str) -> tuple | None:
+        """Queue an effect to end at the start of the caster's turn `rounds` rounds from now; returns (round, turn name)."""
+        if not self.round or not self.order:
+            return None
+        caster_entry = self.lookup(caster)
+        caster_turn = self.order.index(caster_entry.name) if caster_entry and caster_entry.name in self.order else self.turn
+        first_round = self.round if caster_turn > self.turn else self.round + 1
+        ends = (first_round + rounds - 1, caster_turn)
+        heapq.heappush(self.effects, [ends[0], ends[1], self._effect_seq, target, effect, kind])
+        self._effect_seq += 1
+        return ends[0], self.order[caster_turn]
+
+    def cancel(self, target: str, effect: str):
+        remaining = [e for e in self.effects if (e[3], e[4]) != (target, effect)]
+        if len(remaining) != len(self.effects):
+            heapq.heapify(remaining)
+            self.effects = remaining
+
+    def pop_expired(self) -> list:
+        expired = []
+        while self.effects and (self.effects[0][0], self.effects[0][1]) <= (self.round, self.turn):
+            expired.append(heapq.heappop(self.effects))
+        return expired
+
+    def mark_round(self, unit: int):
+        """Remember the journal unit that started the current round, for rollback_combat."""
+        self.round_marks = [m for m in self.round_marks if m[0] < self.round] + [[self.round, unit]]
+
+    def schedule_state(self) -> dict:
+        return {
+            "order": list(self.order), "round": self.round, "turn": self.turn,
+            "effects": [list(e) for e in self.effects], "effect_seq": self._effect_seq,
+            "round_marks": [list(m) for m in self.round_marks],
+        }
+
+    def restore_schedule(self, data: dict):
+        self.order = list(data["order"])
+        self.round, self.turn = data["round"], data["turn"]
+        self.effects = [list(e) for e in data["effects"]]
+        heapq.heapify(self.effects)
+        self._effect_seq = data.get("effect_seq", len(self.effects))
+        self.round_marks = [list(m) for m in data.get("round_marks", ())]
+
+    def to_dict(self) -> dict:
+        return {
+            "combatants": {name: entry.to_dict() for name, entry in self._entries.items()},
+            "troops": {name: group.to_dict() for name, group in self.troops.items()},
+            **self.schedule_state(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_CombatRegistry":
+        registry = cls()
+        data = data or {}
+        combatants = data["combatants"] if "combatants" in data and "order" in data else data
+        for name, fields in combatants.items():
+            registry.add(_Combatant(name, **{k: v for k, v in fields.items() if k in _COMBATANT_FIELDS or k == "aliases"}))
+        if combatants is not data:
+            for name, fields in data.get("troops", {}).items():
+                registry.add_troops(_TroopGroup(name, **fields))
+            registry.restore_schedule(data)
+        return registry
+
+
+_COMBAT_REGISTRY = _CombatRegistry()
 
 
 def get_level_for_xp(xp: int) -> int:
@@ -177,30 +855,87 @@ def get_level_for_xp(xp: int) -> int:
     return level
 
 
-def init_player_db(player_file_path: str) -> str:
-    global DB_CONNECTION
+def _session_db_path(player_file_path: str) -> str:
+    return os.path.splitext(player_file_path)[0] + ".session.db"
+
+
+def _player_file_stamp(player_file_path: str) -> str:
+    return str(os.stat(player_file_path).st_mtime_ns)
+
+
+def _session_is_current(player_file_path: str) -> bool:
+    """True when the open session DB was built from this exact .player file and can be resumed."""
     try:
-        with open(player_file_path, 'r', encoding="utf-8") as f:
-            data = json.load(f)
+        meta = dict(DB_CONNECTION.execute("SELECT key, value FROM session_meta").fetchall())
+        has_rows = DB_CONNECTION.execute("SELECT 1 FROM player_field LIMIT 1").fetchone() is not None
+    except sqlite3.Error:
+        return False
+    return (has_rows
+            and meta.get("player_file") == os.path.abspath(player_file_path)
+            and meta.get("player_stamp") == _player_file_stamp(player_file_path))
+
+
+def _write_session_meta():
+    DB_CONNECTION.executemany(
+        "INSERT OR REPLACE INTO session_meta (key, value) VALUES (?, ?)",
+        [("player_file", os.path.abspath(PLAYER_FILE_PATH)), ("player_stamp", _player_file_stamp(PLAYER_FILE_PATH))],
+    )
 
-        DB_CONNECTION = sqlite3.connect(":memory:")
-        cursor = DB_CONNECTION.cursor()
 
-        cursor.execute("CREATE TABLE player (key TEXT PRIMARY KEY, value TEXT)")
+def init_player_db(player_file_path: str, session_db: bool = False) -> str:
+    """
+    Loads the .player file into the engine database.
 
-        for key, value in data.items():
-            if isinstance(value, (dict, list)):
-                cursor.execute("INSERT INTO player (key, value) VALUES (?, ?)", (key, json.dumps(value)))
-            elif isinstance(value, str):
-                cursor.execute("INSERT INTO player (key, value) VALUES (?, ?)", (key, value))
-            else:
-                cursor.execute("INSERT INTO player (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+    With session_db=True the database lives next to the .player file as <name>.session.db in
+    WAL mode and every tool call is committed to it. If that file is still current for the
+    .player file (the sheet has not been changed since), the session is resumed from it
+    instead, so a crash or restart loses nothing.
+    """
+    global DB_CONNECTION, PLAYER_FILE_PATH, SESSION_DB_PATH
+    try:
+        if DB_CONNECTION is not None:
+            DB_CONNECTION.close()
+        PLAYER_FILE_PATH = player_file_path
+        SESSION_DB_PATH = _session_db_path(player_file_path) if session_db else None
+        _discard_state()
+        _UNIT_EVENTS.clear()
+
+        if SESSION_DB_PATH:
+            DB_CONNECTION = sqlite3.connect(SESSION_DB_PATH)
+            _SESSION_DB_OWNERS[os.path.realpath(SESSION_DB_PATH)] = _ACTIVE_SESSION
+            DB_CONNECTION.execute("PRAGMA journal_mode=WAL")
+            DB_CONNECTION.execute("PRAGMA synchronous=NORMAL")
+            if _session_is_current(player_file_path):
+                _load_journal_position()
+                return f"Database recovered from session {SESSION_DB_PATH}."
+        else:
+            DB_CONNECTION = sqlite3.connect(":memory:")
 
-        DB_CONNECTION.commit()
+        with open(player_file_path, 'r', encoding="utf-8") as f:
+            data = json.load(f)
 
-        cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", ("active_effects", "[]"))
-        cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", ("_active_buff_data", "{}"))
-        cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", ("temporary_hit_points", "0"))
+        cursor = DB_CONNECTION.cursor()
+        cursor.execute("DROP TABLE IF EXISTS player_field")
+        cursor.execute("DROP TABLE IF EXISTS session_meta")
+        cursor.execute("CREATE TABLE player_field (root TEXT NOT NULL, path TEXT PRIMARY KEY, value TEXT)")
+        cursor.execute("CREATE INDEX player_field_root ON player_field (root)")
+        cursor.execute("CREATE TABLE session_meta (key TEXT PRIMARY KEY, value TEXT)")
+        _create_journal(cursor)
+
+        data = {key: _decode_value(value) if isinstance(value, str) else value for key, value in data.items()}
+        data["active_effects"] = []
+        data["_active_buff_data"] = {}
+        data["temporary_hit_points"] = 0
+
+        _STATE_ROWS.clear()
+        for key, value in data.items():
+            fields = _flatten_field(key, value)
+            _STATE_ROWS[key] = fields
+            cursor.executemany("INSERT INTO player_field (root, path, value) VALUES (?, ?, ?)",
+                               [(key, path, text) for path, text in fields.items()])
+        _write_session_meta()
+        _write_snapshot(0, _STATE_ROWS)
+        _load_journal_position()
         DB_CONNECTION.commit()
 
         return f"Database initialized with player data from {player_file_path}."
@@ -208,22 +943,529 @@ def init_player_db(player_file_path: str) -> str:
         return f"Failed to initialize database: {str(e)}"
 
 
-def _db_val(cursor, key, default=None):
-    cursor.execute("SELECT value FROM player WHERE key = ?", (key,))
-    row = cursor.fetchone()
-    if row is None:
-        return default
+# ── NORMALIZED PLAYER STORAGE ──
+# Each leaf of the character sheet is its own player_field row, addressed by
+# its dotted path (spellcasting.slots.1, consumables.Bolts, ...). Dicts are
+# flattened; lists and empty dicts are stored whole as JSON leaves. Rows are
+# kept in insertion order so the rebuilt sheet has the original key order.
+
+_PATH_SEP = "\x1f"
+_STATE_ROWS: dict[str, dict[str, str]] = {}
+
+
+def _flatten_field(path: str, value, out: dict | None = None) -> dict:
+    if out is None:
+        out = {}
+    if isinstance(value, dict) and value:
+        for k, v in value.items():
+            _flatten_field(f"{path}{_PATH_SEP}{k}", v, out)
+    else:
+        out[path] = json.dumps(value)
+    return out
+
+
+def _unflatten_rows(rows) -> tuple[dict, dict]:
+    state, by_root = {}, {}
+    for root, path, text in rows:
+        by_root.setdefault(root, {})[path] = text
+        parts = path.split(_PATH_SEP)
+        node = state
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = json.loads(text)
+    return state, by_root
+
+
+# ── MUTATION JOURNAL ──
+# Every committed change is appended to the journal as (unit, tool, path, old,
+# new), where a unit is one outermost tool call. Player fields use their
+# player_field path; combat registry changes use paths under "@combat". A full
+# player_field snapshot is stored every JOURNAL_SNAPSHOT_INTERVAL events, so any
+# point in the session is rebuilt by replaying a bounded tail of the journal.
+# The journal sequence number doubles as the state version: each top-level key
+# remembers the last seq that changed it, for dump_player_db(since_version=...).
+
+JOURNAL_SNAPSHOT_INTERVAL = 200
+_REGISTRY_PATH = "@combat"
+_SCHEDULE_KEY = "@schedule"
+_UNDO_TOOLS = ("undo_last_action", "rollback_combat")
+
+_UNIT_TOOL = None
+_UNIT_EVENTS: list[tuple[str, str | None, str | None]] = []
+_JOURNAL_UNIT = 0
+_JOURNAL_SNAPSHOT_SEQ = 0
+_STATE_VERSION = 0
+_KEY_VERSIONS: dict[str, int] = {}
+
+
+def _create_journal(cursor):
+    cursor.execute("DROP TABLE IF EXISTS journal")
+    cursor.execute("DROP TABLE IF EXISTS journal_snapshot")
+    cursor.execute("CREATE TABLE journal (seq INTEGER PRIMARY KEY, unit INTEGER NOT NULL, tool TEXT, "
+                   "path TEXT NOT NULL, old TEXT, new TEXT, undone INTEGER NOT NULL DEFAULT 0)")
+    cursor.execute("CREATE INDEX journal_unit ON journal (unit)")
+    cursor.execute("CREATE TABLE journal_snapshot (seq INTEGER PRIMARY KEY, rows TEXT NOT NULL)")
+
+
+def _load_journal_position():
+    global _JOURNAL_UNIT, _JOURNAL_SNAPSHOT_SEQ, _STATE_VERSION
+    _JOURNAL_UNIT, _STATE_VERSION = DB_CONNECTION.execute(
+        "SELECT COALESCE(MAX(unit), 0), COALESCE(MAX(seq), 0) FROM journal"
+    ).fetchone()
+    _JOURNAL_SNAPSHOT_SEQ = DB_CONNECTION.execute("SELECT COALESCE(MAX(seq), 0) FROM journal_snapshot").fetchone()[0]
+    _KEY_VERSIONS.clear()
+    for path, seq in DB_CONNECTION.execute("SELECT path, MAX(seq) FROM journal GROUP BY path"):
+        if not path.startswith(_REGISTRY_PATH):
+            root = path.split(_PATH_SEP, 1)[0]
+            _KEY_VERSIONS[root] = max(seq, _KEY_VERSIONS.get(root, 0))
+
+
+def _write_snapshot(seq: int, rows_by_root: dict):
+    global _JOURNAL_SNAPSHOT_SEQ
+    rows = [[root, path, text] for root, fields in rows_by_root.items() for path, text in fields.items()]
+    DB_CONNECTION.execute("INSERT OR REPLACE INTO journal_snapshot (seq, rows) VALUES (?, ?)", (seq, json.dumps(rows)))
+    _JOURNAL_SNAPSHOT_SEQ = seq
+
+
+def _journal_rows_at(seq: int) -> list:
+    """Rebuild the player_field rows as they were right after journal entry seq."""
+    snap_seq, snap_rows = DB_CONNECTION.execute(
+        "SELECT seq, rows FROM journal_snapshot WHERE seq <= ? ORDER BY seq DESC LIMIT 1", (seq,)
+    ).fetchone()
+    rows = {path: (root, text) for root, path, text in json.loads(snap_rows)}
+    tail = DB_CONNECTION.execute(
+        "SELECT path, new FROM journal WHERE seq > ? AND seq <= ? ORDER BY seq", (snap_seq, seq)
+    )
+    for path, new in tail:
+        if path.startswith(_REGISTRY_PATH):
+            continue
+        if new is None:
+            rows.pop(path, None)
+        else:
+            rows[path] = (path.split(_PATH_SEP, 1)[0], new)
+    return [(root, path, text) for path, (root, text) in rows.items()]
+
+
+def _registry_path(*parts) -> str:
+    return _PATH_SEP.join((_REGISTRY_PATH,) + parts)
+
+
+def _journal_schedule(before: dict):
+    """Journal a change to the turn order, round counter or timed effects (not the combatants)."""
+    _journal_registry(_registry_path(_SCHEDULE_KEY), before, _COMBAT_REGISTRY.schedule_state())
+
+
+def _journal_conditions(entry, before: list):
+    _journal_registry(_registry_path(entry.name, "conditions"), before, list(entry.conditions))
+
+
+def _set_troop_share(group, condition: str, affected: int | None):
+    """Record how many troops of a group a condition covers (None: the whole group)."""
+    before = dict(group.affected)
+    if affected is None:
+        group.affected.pop(condition, None)
+    else:
+        group.affected[condition] = affected
+    if group.affected != before:
+        _journal_registry(_registry_path(group.name, "affected"), before, dict(group.affected))
+
+
+def _journal_registry(path: str, old, new):
+    _UNIT_EVENTS.append((path, json.dumps(old), json.dumps(new)))
+
+
+def _registry_value(path: str):
+    parts = path.split(_PATH_SEP)[1:]
+    if not parts:
+        return _COMBAT_REGISTRY.to_dict()
+    if parts == [_SCHEDULE_KEY]:
+        return _COMBAT_REGISTRY.schedule_state()
+    entry = _COMBAT_REGISTRY.member(parts[0])
+    if entry is None:
+        return None
+    value = getattr(entry, parts[1])
+    return list(value) if isinstance(value, array) else value
+
+
+def _apply_registry_value(path: str, text: str):
+    global _COMBAT_REGISTRY
+    value = json.loads(text)
+    parts = path.split(_PATH_SEP)[1:]
+    if not parts:
+        _COMBAT_REGISTRY = _CombatRegistry.from_dict(value)
+    elif parts == [_SCHEDULE_KEY]:
+        _COMBAT_REGISTRY.restore_schedule(value)
+    else:
+        entry = _COMBAT_REGISTRY.member(parts[0])
+        if entry:
+            setattr(entry, parts[1], array("l", value) if isinstance(entry, _TroopGroup) and parts[1] == "hp" else value)
+
+
+# ── DECODED STATE CACHE ──
+# Every player row is decoded once and served from memory. Writes land in the
+# cache and mark the key dirty. Each tool invocation is one unit of work: when
+# the outermost call returns, its dirty keys are written in one transaction
+# together with their journal entries; if it raised (or a handler called
+# _fail_unit), the cache is dropped, registry changes are reverted from the
+# unit's events, and the next read reloads the last committed state. Only the
+# leaf rows that actually changed are written.
+
+_STATE_CACHE: dict | None = None
+_STATE_DIRTY: set[str] = set()
+_TOOL_DEPTH = 0
+_UNIT_FAILED = False
+
+
+def _decode_value(raw):
     try:
-        return json.loads(row[0])
+        return json.loads(raw)
     except (json.JSONDecodeError, TypeError):
-        return row[0]
+        return raw
+
+
+def _state() -> dict:
+    global _STATE_CACHE
+    if _STATE_CACHE is None:
+        rows = DB_CONNECTION.execute("SELECT root, path, value FROM player_field ORDER BY rowid").fetchall()
+        _STATE_CACHE, by_root = _unflatten_rows(rows)
+        _STATE_ROWS.clear()
+        _STATE_ROWS.update(by_root)
+    return _STATE_CACHE
+
+
+def _discard_state():
+    global _STATE_CACHE
+    _STATE_CACHE = None
+    _STATE_DIRTY.clear()
+
+
+def _flush_state():
+    global _JOURNAL_UNIT, _STATE_VERSION
+    if DB_CONNECTION is None or (not _STATE_DIRTY and not _UNIT_EVENTS):
+        return
+    updates, inserts, deletes, events = [], [], [], []
+    new_rows = {}
+    for root in _STATE_DIRTY:
+        old = _STATE_ROWS.get(root, {})
+        new = _flatten_field(root, _STATE_CACHE[root]) if root in _STATE_CACHE else {}
+        for path, text in new.items():
+            if path not in old:
+                inserts.append((root, path, text))
+                events.append((path, None, text))
+            elif old[path] != text:
+                updates.append((text, path))
+                events.append((path, old[path], text))
+        for path, text in old.items():
+            if path not in new:
+                deletes.append((path,))
+                events.append((path, text, None))
+        new_rows[root] = new
+    events.extend(_UNIT_EVENTS)
+    try:
+        DB_CONNECTION.executemany("DELETE FROM player_field WHERE path = ?", deletes)
+        DB_CONNECTION.executemany("UPDATE player_field SET value = ? WHERE path = ?", updates)
+        DB_CONNECTION.executemany("INSERT INTO player_field (root, path, value) VALUES (?, ?, ?)", inserts)
+        if events:
+            _JOURNAL_UNIT += 1
+            DB_CONNECTION.executemany(
+                "INSERT INTO journal (unit, tool, path, old, new) VALUES (?, ?, ?, ?, ?)",
+                [(_JOURNAL_UNIT, _UNIT_TOOL, path, old, new) for path, old, new in events],
+            )
+            seq = DB_CONNECTION.execute("SELECT MAX(seq) FROM journal").fetchone()[0]
+            if seq - _JOURNAL_SNAPSHOT_SEQ >= JOURNAL_SNAPSHOT_INTERVAL:
+                _write_snapshot(seq, {**_STATE_ROWS, **new_rows})
+        DB_CONNECTION.commit()
+    except sqlite3.Error:
+        DB_CONNECTION.rollback()
+        _discard_state()
+        raise
+    if events:
+        _STATE_VERSION = seq
+        for path, old, new in events:
+            if not path.startswith(_REGISTRY_PATH):
+                _KEY_VERSIONS[path.split(_PATH_SEP, 1)[0]] = seq
+    _STATE_ROWS.update(new_rows)
+    _STATE_DIRTY.clear()
+    _UNIT_EVENTS.clear()
+
+
+def _fail_unit():
+    """Mark the running tool call as failed so none of its writes are committed."""
+    global _UNIT_FAILED
+    _UNIT_FAILED = True
+
+
+def _end_unit():
+    global _UNIT_FAILED, _UNIT_TOOL
+    failed, _UNIT_FAILED = _UNIT_FAILED, False
+    if failed:
+        for path, old, new in reversed(_UNIT_EVENTS):
+            _apply_registry_value(path, old)
+        _UNIT_EVENTS.clear()
+        _discard_state()
+        if DB_CONNECTION is not None:
+            DB_CONNECTION.rollback()
+    else:
+        _flush_state()
+        if DB_CONNECTION is not None and DB_CONNECTION.in_transaction:
+            DB_CONNECTION.commit()
+    _UNIT_TOOL = None
+
+
+# ── SESSIONS ──
+# Per-game state lives in module globals so the tools stay plain functions.
+# When one process serves many clients over HTTP/SSE, every client session
+# keeps its own copy of the globals in _SESSION_GLOBALS and _game_tool swaps
+# the caller's copy in before the tool body runs. Tools execute one at a time
+# on the event loop, so exactly one session is live at any moment. Under stdio
+# (or when called directly) everything runs in the default session. The spell
+# database is read-only and shared by all sessions.
+
+_SESSION_GLOBALS = (
+    "DB_CONNECTION", "PLAYER_FILE_PATH", "SESSION_DB_PATH", "_COMBAT_REGISTRY",
+    "_STATE_CACHE", "_STATE_DIRTY", "_STATE_ROWS", "_UNIT_EVENTS",
+    "_JOURNAL_UNIT", "_JOURNAL_SNAPSHOT_SEQ", "_STATE_VERSION", "_KEY_VERSIONS",
+)
+PLAYER_ROOT = "output"
+
+
+class _DefaultSession:
+    pass
+
+
+_DEFAULT_SESSION = _DefaultSession()
+_SESSION_SCOPED = False
+_ACTIVE_SESSION = _DEFAULT_SESSION
+_SESSIONS: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+# A session DB has exactly one writer: the session that opened it. Another session opening the same
+# file (a client reconnecting while its old session is still alive) takes that state over instead of
+# opening a second connection that would flush a stale cache over the first one's writes.
+_SESSION_DB_OWNERS: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+
+
+def _fresh_session_state() -> dict:
+    return {
+        "DB_CONNECTION": None, "PLAYER_FILE_PATH": None, "SESSION_DB_PATH": None,
+        "_COMBAT_REGISTRY": _CombatRegistry(), "_STATE_CACHE": None, "_STATE_DIRTY": set(),
+        "_STATE_ROWS": {}, "_UNIT_EVENTS": [], "_JOURNAL_UNIT": 0,
+        "_JOURNAL_SNAPSHOT_SEQ": 0, "_STATE_VERSION": 0, "_KEY_VERSIONS": {},
+    }
+
+
+def _session_key():
+    if not _SESSION_SCOPED:
+        return _DEFAULT_SESSION
+    try:
+        return mcp.get_context().session
+    except ValueError:
+        return _DEFAULT_SESSION
+
+
+def _session_db_owner(db_path: str):
+    """The live session, other than the active one, that holds db_path open, or None."""
+    owner = _SESSION_DB_OWNERS.get(os.path.realpath(db_path))
+    state = _SESSIONS.get(owner) if owner is not None and owner is not _ACTIVE_SESSION else None
+    if (state is None or state["DB_CONNECTION"] is None or state["SESSION_DB_PATH"] is None
+            or os.path.realpath(state["SESSION_DB_PATH"]) != os.path.realpath(db_path)):
+        return None
+    return owner
+
+
+def _take_over_session(owner):
+    """Move owner's game state into the active session; owner is left with a fresh, empty one."""
+    if DB_CONNECTION is not None:
+        DB_CONNECTION.close()
+    globals().update(_SESSIONS[owner])
+    _SESSIONS[owner] = _fresh_session_state()
+    _SESSION_DB_OWNERS[os.path.realpath(SESSION_DB_PATH)] = _ACTIVE_SESSION
+
+
+def _activate_session(key):
+    """Swap the globals in _SESSION_GLOBALS over to the state of session key."""
+    global _ACTIVE_SESSION
+    if key is _ACTIVE_SESSION:
+        return
+    module = globals()
+    _SESSIONS[_ACTIVE_SESSION] = {name: module[name] for name in _SESSION_GLOBALS}
+    state = _SESSIONS.pop(key, None)
+    module.update(state if state is not None else _fresh_session_state())
+    _ACTIVE_SESSION = key
+
+
+# Tool results are serialized into the GM conversation and re-sent with every
+# later model call. Under the compact profile (the default) MCP clients get the
+# narrative plus only the state deltas the GM acts on, under short keys:
+#   ok     success                     n      narrative_format (or message)
+#   hp     {name: HP left} (troop groups: "N standing")
+#   php    player HP line after damage or healing
+#   kills  combatants killed           xp     XP awarded
+#   lvl    level-up message            slots  spell slots left
+#   cond   {name: [conditions]}        exp    {name: [effects that ended]}
+#   rnd / turn / next                  round, whose turn, who is up next
+#   list   a list after update_player_list (kept even when empty)
+#   prep   prepared spells {n, max, free} when the list is spells_prepared
+# plus dmg, heal, v (new value), ends, dur, pool, buffs, rev, order, reg,
+# from, hint and totals (roll_dice_batch). resolve_round sends its combined
+# narrative once and each action's deltas under acts. Only the tools in
+# COMPACT_TOOLS are compacted; session and sheet tools (open_session,
+# save_player, dump_player_db) and query_spells keep their own formats.
+# Failed calls keep all their keys. Compact results go out as
+# minified JSON rather than FastMCP's indented dump. The Python functions always
+# return the verbose dicts; --response-profile verbose serves those to MCP
+# clients too, for debugging.
+RESPONSE_PROFILES = ("compact", "verbose")
+RESPONSE_PROFILE = "compact"
+COMPACT_TOOLS = frozenset({
+    "resolve_attack", "resolve_magic", "resolve_round", "modify_player_numeric", "update_player_list",
+    "register_combatants", "next_turn", "update_condition", "rest", "roll_dice", "roll_dice_batch",
+    "perform_check", "undo_last_action", "rollback_combat",
+})
+COMPACT_KEYS = (
+    ("new_value", "v"), ("damage_total", "dmg"), ("healing_total", "heal"), ("xp_awarded", "xp"),
+    ("targets_killed", "kills"), ("remaining_slots", "slots"), ("hp_pool_remaining", "pool"),
+    ("duration_reminder", "dur"), ("effect_ends", "ends"), ("resolved_from", "from"), ("round", "rnd"),
+    ("current_turn", "turn"), ("up_next", "next"), ("initiative_order", "order"), ("death_saves", "down"),
+    ("reverted", "rev"), ("hints", "hint"), ("total", "total"), ("affected", "part"),
+)
+
+
+def _present(value) -> bool:
+    return value is not None and value is not False and value != "" and value != [] and value != {}
+
+
+def _compact_deltas(result: dict, out: dict):
+    """Collect HP, kill, XP, slot and condition changes from a verbose result and the results nested in it."""
+    hp, kills, cond = out.setdefault("hp", {}), out.setdefault("kills", []), out.setdefault("cond", {})
+    name = result.get("target_name")
+    if name and "target_remaining_hp" in result and "hp_change" not in result:
+        hp[name] = max(0, result["target_remaining_hp"])
+    if name and result.get("target_killed") and name not in kills:
+        kills.append(name)
+    for target in result.get("targets") or ():
+        if "remaining_hp" in target:
+            hp[target["name"]] = target["remaining_hp"]
+        if target.get("killed") and target["name"] not in kills:
+            kills.append(target["name"])
+    for group in result.get("troops") or ():
+        hp[group["name"]] = f"{group['standing']} standing"
+    for applied in result.get("conditions_applied") or ():
+        cond.setdefault(applied["name"], []).append(applied["condition"])
+    if result.get("current_turn") and "hp" in result:
+        hp[result["current_turn"]] = result["hp"]
+    if result.get("conditions"):
+        cond[result.get("name") or result.get("current_turn")] = list(result["conditions"])
+    for ended in result.get("expired") or ():
+        out.setdefault("exp", {}).setdefault(ended["name"], []).append(ended["effect"])
+    hp_change = result.get("hp_change")
+    if isinstance(hp_change, dict) and hp_change.get("success"):
+        out["php"] = hp_change.get("message") or hp_change.get("hp_status")
+    xp_result = result.get("xp_result")
+    if isinstance(xp_result, dict) and xp_result.get("level_up"):
+        out["lvl"] = xp_result["message"]
+    slot_result = result.get("slot_result")
+    if isinstance(slot_result, dict) and slot_result.get("remaining_slots"):
+        out["slots"] = slot_result["remaining_slots"]
+    if result.get("buffs_applied"):
+        out["buffs"] = {field: change.get("new") for field, change in result["buffs_applied"].items()}
+    if "current_list" in result:
+        out["list"] = result["current_list"]
+    prepared = result.get("spells_prepared_info")
+    if isinstance(prepared, dict):
+        out["prep"] = {short: prepared[key] for key, short in
+                       (("current_count", "n"), ("max_count", "max"), ("available_slots", "free")) if key in prepared}
+    for swing in result.get("attacks") or result.get("beams") or ():
+        if "result" in swing:
+            _compact_deltas(swing["result"], out)
+
+
+def _compact_response(result):
+    """The compact profile of a tool result: narrative, short-keyed deltas, nothing the GM does not act on."""
+    if not isinstance(result, dict) or result.get("success") is False or "error" in result:
+        return result
+    out = {"ok": True}
+    text = result.get("narrative_format") or result.get("message")
+    if text:
+        out["n"] = text
+    _compact_deltas(result, out)
+    for long_key, short_key in COMPACT_KEYS:
+        value = result.get(long_key)
+        if _present(value) and (value != 0 or short_key in ("v", "total")):
+            out.setdefault(short_key, value)
+    if result.get("is_player"):
+        out["pc"] = True
+    if result.get("registry_summary"):
+        out["reg"] = {e["name"]: f"{e.get('hp') or e.get('troops')} AC {e['ac']}" for e in result["registry_summary"]}
+    if isinstance(result.get("results"), list) and all("notation" in r for r in result["results"]):
+        out["totals"] = [r.get("total") for r in result["results"]]
+    return {k: v for k, v in out.items() if _present(v) or k == "list"}
+
+
+def _compact_round(result):
+    """resolve_round's compact profile: the combined narrative once, then each action's deltas without it."""
+    if not isinstance(result, dict) or result.get("success") is False:
+        return result
+    acts = []
+    for entry in result.get("results", ()):
+        compact = _compact_response(entry["result"])
+        if compact.get("ok"):
+            compact = {k: v for k, v in compact.items() if k not in ("ok", "n")}
+        acts.append(compact)
+    out = {"ok": True, "n": result.get("narrative_format", ""), "acts": acts}
+    if result.get("actions_failed"):
+        out["failed"] = result["actions_failed"]
+    return out
+
+
+_COMPACTORS = {"resolve_round": _compact_round}
+
+
+def _serve(fn, call):
+    """Register `call` as the MCP tool for fn (same name, signature and docstring) under the response profile."""
+    @functools.wraps(fn)
+    def served(*args, **kwargs):
+        result = call(*args, **kwargs)
+        if RESPONSE_PROFILE == "compact" and fn.__name__ in COMPACT_TOOLS:
+            compact = _COMPACTORS.get(fn.__name__, _compact_response)(result)
+            return json.dumps(compact, ensure_ascii=False, separators=(",", ":"), default=str)
+        return result
+
+    mcp.tool()(served)
+
+
+def _game_tool(fn):
+    """Register fn as an MCP tool that runs as one unit of work (nested tool calls join the caller's)."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        global _TOOL_DEPTH, _UNIT_TOOL
+        if _TOOL_DEPTH == 0:
+            _activate_session(_session_key())
+            _UNIT_TOOL = fn.__name__
+        _TOOL_DEPTH += 1
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            _fail_unit()
+            raise
+        finally:
+            _TOOL_DEPTH -= 1
+            if _TOOL_DEPTH == 0:
+                _end_unit()
+
+    _serve(fn, wrapper)
+    return wrapper
+
+
+def _db_val(cursor, key, default=None):
+    return _state().get(key, default)
 
 
 def _db_set(cursor, key, value):
-    if isinstance(value, (dict, list)):
-        cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (key, json.dumps(value)))
-    else:
-        cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (key, str(value)))
+    if not isinstance(value, (dict, list)):
+        value = _decode_value(str(value))
+    _state()[key] = value
+    _STATE_DIRTY.add(key)
+    if _TOOL_DEPTH == 0:
+        _flush_state()
 
 
 def _player_name(cursor):
@@ -252,26 +1494,132 @@ def _format_hp_status(current, total):
     return f"HP: {current}/{total} ({tag} {pct}%)"
 
 
+DICE_CACHE_SIZE = 512
+
+_DICE_TERM_RE = re.compile(r"([+-])?(?:(\d*)d(\d+)(?:(kh|kl|k)(\d+))?(?:r(\d+))?|(\d+))")
+
+
+class _DiceTerm(NamedTuple):
+    sign: int
+    count: int
+    size: int
+    keep: str | None = None
+    keep_n: int = 0
+    reroll: int = 0
+
+
+class _DiceExpr(NamedTuple):
+    terms: tuple
+    flat: int = 0
+
+    @property
+    def die_size(self) -> int:
+        return self.terms[0].size if self.terms else 0
+
+
+@functools.lru_cache(maxsize=DICE_CACHE_SIZE)
+def _compile_dice(dice_notation: str) -> _DiceExpr | None:
+    """
+    Compile a dice expression into terms. Returns None for invalid notation.
+
+    Supports any number of dice terms and flat modifiers joined by + or -,
+    keep-highest/lowest ('4d6kh3', '2d20kl1') and reroll-once ('2d6r2' rerolls 1s and 2s).
+    Compiled expressions are cached by notation string, so hot combat loops
+    never re-parse the same '1d8' or '8d6'.
+    """
+    s = str(dice_notation).lower().replace(" ", "")
+    if not s:
+        return None
+    terms = []
+    flat = 0
+    pos = 0
+    while pos < len(s):
+        m = _DICE_TERM_RE.match(s, pos)
+        if m is None or m.end() == pos or (m.group(1) is None and pos > 0):
+            return None
+        sign = -1 if m.group(1) == "-" else 1
+        if m.group(7) is not None:
+            flat += sign * int(m.group(7))
+        else:
+            count = int(m.group(2)) if m.group(2) else 1
+            size = int(m.group(3))
+            keep = None
+            keep_n = 0
+            if m.group(4):
+                keep = "l" if m.group(4) == "kl" else "h"
+                keep_n = min(int(m.group(5)), count)
+            reroll = int(m.group(6)) if m.group(6) else 0
+            if reroll >= size > 0:
+                return None
+            if count > 0 and size > 0:
+                terms.append(_DiceTerm(sign, count, size, keep, keep_n, reroll))
+        pos = m.end()
+    return _DiceExpr(tuple(terms), flat)
+
+
+def _render_dice(expr: _DiceExpr) -> str:
+    parts = []
+    for t in expr.terms:
+        term = f"{t.count}d{t.size}"
+        if t.keep:
+            term += f"k{t.keep}{t.keep_n}"
+        if t.reroll:
+            term += f"r{t.reroll}"
+        parts.append(("-" if t.sign < 0 else "+") + term)
+    if expr.flat:
+        parts.append(f"{expr.flat:+d}")
+    if not parts:
+        return "0d0"
+    rendered = "".join(parts)
+    return rendered[1:] if rendered.startswith("+") else rendered
+
+
+def _roll_dice_term(term: _DiceTerm) -> list:
+    return _finish_dice_term(term, [random.randint(1, term.size) for _ in range(term.count)])
+
+
+def _finish_dice_term(term: _DiceTerm, rolls: list) -> list:
+    if term.reroll:
+        rolls = [random.randint(1, term.size) if r <= term.reroll else r for r in rolls]
+    if term.keep:
+        order = sorted(range(len(rolls)), key=lambda i: rolls[i], reverse=(term.keep == "h"))
+        kept = set(order[:term.keep_n])
+        rolls = [r for i, r in enumerate(rolls) if i in kept]
+    if term.sign < 0:
+        rolls = [-r for r in rolls]
+    return rolls
+
+
+def _roll_dice_expr(expr: _DiceExpr) -> list:
+    rolls = []
+    for term in expr.terms:
+        rolls.extend(_roll_dice_term(term))
+    return rolls
+
+
+def _roll_dice_with_flat(dice_notation):
+    """Roll a notation and return (die_size, rolls, flat) — the flat part of the expression kept separate."""
+    if isinstance(dice_notation, (int, float)):
+        return 0, [], int(dice_notation)
+    expr = _compile_dice(str(dice_notation).strip())
+    if expr is None:
+        return None, [], 0
+    return expr.die_size, _roll_dice_expr(expr), expr.flat
+
+
+def _roll_crit_dice(dice_notation) -> list:
+    """Roll the dice part of a notation again for a critical hit (flat modifiers are not doubled)."""
+    expr = _compile_dice(str(dice_notation).strip())
+    if expr is None:
+        return []
+    return _roll_dice_expr(expr)
+
+
 def _parse_and_roll_dice(dice_notation):
-    try:
-        if isinstance(dice_notation, (int, float)):
-            return 0, [], int(dice_notation)
-        s = str(dice_notation).strip().lower()
-        if s.isdigit():
-            return 0, [], int(s)
-        parts = s.split('d')
-        if len(parts) != 2:
-            return None, [], 0
-        num_dice = int(parts[0]) if parts[0] else 1
-        die_size = int(parts[1])
-        if num_dice == 0 or die_size == 0:
-            return 0, [], 0
-        if num_dice < 0 or die_size < 0:
-            return None, [], 0
-        rolls = [random.randint(1, die_size) for _ in range(num_dice)]
-        return die_size, rolls, sum(rolls)
-    except (ValueError, TypeError):
+    die_size, rolls, flat = _roll_dice_with_flat(dice_notation)
+    if die_size is None:
         return None, [], 0
+    return die_size, rolls, sum(rolls) + flat
 
 
 def _apply_hp_change(cursor, delta):
@@ -287,7 +1635,6 @@ def _apply_hp_change(cursor, delta):
             thp_absorbed = damage
             new_thp = thp - damage
             _db_set(cursor, "temporary_hit_points", str(new_thp))
-            DB_CONNECTION.commit()
             if new_thp == 0:
                 effect_expired = _cleanup_thp_effects(cursor)
             result = {
@@ -304,7 +1651,6 @@ def _apply_hp_change(cursor, delta):
         else:
             thp_absorbed = thp
             _db_set(cursor, "temporary_hit_points", "0")
-            DB_CONNECTION.commit()
             effect_expired = _cleanup_thp_effects(cursor)
             delta = -(damage - thp)
 
@@ -320,7 +1666,6 @@ def _apply_hp_change(cursor, delta):
         clamped = True
 
     _db_set(cursor, "current_hit_points", str(new_val))
-    DB_CONNECTION.commit()
 
     result = {
         "success": True,
@@ -379,7 +1724,6 @@ def _cleanup_thp_effects(cursor):
     if removed:
         _db_set(cursor, "_active_buff_data", buff_data_raw)
         _db_set(cursor, "active_effects", effects_list)
-        DB_CONNECTION.commit()
         names = ", ".join(removed)
         return f"{names} has expired — temporary HP depleted. "
     return ""
@@ -447,25 +1791,19 @@ PREPARED_CASTER_ABILITIES = {
 
 
 def get_max_prepared_spells(cursor) -> int | None:
-    cursor.execute("SELECT value FROM player WHERE key = ?", ("character_class",))
-    row = cursor.fetchone()
-    if not row:
+    char_class = _db_val(cursor, "character_class")
+    if char_class is None:
         return None
 
-    char_class = row[0]
     stat_key = PREPARED_CASTER_ABILITIES.get(char_class)
     if stat_key is None:
         return None
 
-    cursor.execute("SELECT value FROM player WHERE key = ?", ("level",))
-    level_row = cursor.fetchone()
-    level = int(level_row[0]) if level_row else 1
+    level = int(_db_val(cursor, "level", 1))
 
-    cursor.execute("SELECT value FROM player WHERE key = ?", ("stats",))
-    stats_row = cursor.fetchone()
-    if not stats_row:
+    stats = _db_val(cursor, "stats")
+    if not stats:
         return None
-    stats = json.loads(stats_row[0])
     stat_val = int(stats.get(stat_key, 10))
 
     modifier = (stat_val - 10) // 2
@@ -477,11 +1815,9 @@ def build_prepared_spells_info(cursor) -> dict | None:
     if max_spells is None:
         return None
 
-    cursor.execute("SELECT value FROM player WHERE key = ?", ("spellcasting",))
-    sc_row = cursor.fetchone()
-    if not sc_row:
+    sc = _db_val(cursor, "spellcasting")
+    if not sc:
         return None
-    sc = json.loads(sc_row[0])
     current_prepared = sc.get("spells_prepared", [])
     current_count = len(current_prepared)
     available = max_spells - current_count
@@ -514,12 +1850,10 @@ def _validate_spell_slot(cursor, slot_key, delta):
     if delta >= 0:
         return None
 
-    cursor.execute("SELECT value FROM player WHERE key = ?", ("spellcasting",))
-    row = cursor.fetchone()
-    if not row:
+    sc = _db_val(cursor, "spellcasting")
+    if not sc:
         return None
 
-    sc = json.loads(row[0])
     slots = sc.get("slots", {})
     slot_level = slot_key.split(".")[-1]
 
@@ -535,7 +1869,7 @@ def _validate_spell_slot(cursor, slot_key, delta):
     return None
 
 
-@mcp.tool()
+@_game_tool
 def modify_player_numeric(key: str, delta: int) -> dict:
     """
     Increments or decrements a numeric player attribute. Supports dotted notation for nested paths.
@@ -573,7 +1907,6 @@ def modify_player_numeric(key: str, delta: int) -> dict:
             current_val = int(_db_val(cursor, "temporary_hit_points", 0))
             new_val = max(current_val + delta, 0)
             _db_set(cursor, "temporary_hit_points", str(new_val))
-            DB_CONNECTION.commit()
             result = {
                 "success": True,
                 "key": key,
@@ -603,20 +1936,16 @@ def modify_player_numeric(key: str, delta: int) -> dict:
 
         if '.' in key:
             root_key = key.split('.')[0]
-            cursor.execute("SELECT value FROM player WHERE key = ?", (root_key,))
-            row = cursor.fetchone()
+            data = _db_val(cursor, root_key)
 
             auto_init_root = False
-            if not row:
+            if data is None:
                 if root_key == "consumables":
                     data = {}
                     auto_init_root = True
                 else:
-                    cursor.execute("SELECT key FROM player")
-                    available = [r[0] for r in cursor.fetchall()]
+                    available = list(_state().keys())
                     return {"success": False, "error": f"Root key '{root_key}' not found.", "available_keys": available, "key": key}
-            else:
-                data = json.loads(row[0])
 
             path_in_obj = key[len(root_key)+1:]
             current_val = get_nested_value(data, path_in_obj)
@@ -637,8 +1966,7 @@ def modify_player_numeric(key: str, delta: int) -> dict:
                 consumable_name = path_in_obj
                 if new_val < 0:
                     data[consumable_name] = 0
-                    cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (root_key, json.dumps(data)))
-                    DB_CONNECTION.commit()
+                    _db_set(cursor, root_key, data)
                     return {
                         "success": True,
                         "key": key,
@@ -649,8 +1977,7 @@ def modify_player_numeric(key: str, delta: int) -> dict:
                         "message": f"Consumable '{consumable_name}' cannot go below 0. Set to 0.",
                     }
                 del data[consumable_name]
-                cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (root_key, json.dumps(data)))
-                DB_CONNECTION.commit()
+                _db_set(cursor, root_key, data)
                 return {
                     "success": True,
                     "key": key,
@@ -662,20 +1989,17 @@ def modify_player_numeric(key: str, delta: int) -> dict:
                     "message": f"DEPLETED — {consumable_name} has been used up and removed from consumables.",
                 }
 
-            cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (root_key, json.dumps(data)))
+            _db_set(cursor, root_key, data)
         else:
-            cursor.execute("SELECT value FROM player WHERE key = ?", (key,))
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute("SELECT key FROM player")
-                available = [r[0] for r in cursor.fetchall()]
+            current_val = _db_val(cursor, key)
+            if current_val is None:
+                available = list(_state().keys())
                 return {"success": False, "error": f"Key '{key}' not found in database.", "available_keys": available, "key": key}
 
-            current_val = int(row[0])
+            current_val = int(current_val)
             new_val = current_val + delta
-            cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (key, str(new_val)))
+            _db_set(cursor, key, str(new_val))
 
-        DB_CONNECTION.commit()
         result = {
             "success": True,
             "key": key,
@@ -684,26 +2008,20 @@ def modify_player_numeric(key: str, delta: int) -> dict:
             "delta": delta,
         }
         if key.startswith("spellcasting.slots."):
-            cursor.execute("SELECT value FROM player WHERE key = ?", ("spellcasting",))
-            sc_row = cursor.fetchone()
-            if sc_row:
-                sc_data = json.loads(sc_row[0])
+            sc_data = _db_val(cursor, "spellcasting")
+            if sc_data:
                 result["remaining_slots"] = {f"lv{k}": v for k, v in sc_data.get("slots", {}).items()}
         if key == "xp":
-            cursor.execute("SELECT value FROM player WHERE key = ?", ("level",))
-            level_row = cursor.fetchone()
-            if level_row:
-                current_level = int(level_row[0])
+            level_val = _db_val(cursor, "level")
+            if level_val is not None:
+                current_level = int(level_val)
                 new_level = get_level_for_xp(new_val)
                 if new_level > current_level:
-                    cursor.execute("SELECT key, value FROM player")
-                    all_rows = cursor.fetchall()
-                    player_data = {row[0]: row[1] for row in all_rows}
+                    player_data = dict(_state())
                     character_class = player_data.get('character_class', '')
                     changes, summary = apply_level_up(character_class, current_level, new_level, player_data)
                     for db_key, db_value in changes.items():
-                        cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (db_key, db_value))
-                    DB_CONNECTION.commit()
+                        _db_set(cursor, db_key, db_value)
 
                     total_hp = int(changes.get('total_hit_points', _db_val(cursor, 'total_hit_points', 0)))
                     current_hp = int(changes.get('current_hit_points', _db_val(cursor, 'current_hit_points', 0)))
@@ -722,10 +2040,11 @@ def modify_player_numeric(key: str, delta: int) -> dict:
                     )
         return result
     except Exception as e:
+        _fail_unit()
         return {"success": False, "error": f"Error modifying numeric value: {str(e)}", "key": key}
 
 
-@mcp.tool()
+@_game_tool
 def update_player_list(key: str, item: str, action: str) -> dict:
     """
     Adds or removes an item from a player list.
@@ -758,30 +2077,23 @@ def update_player_list(key: str, item: str, action: str) -> dict:
 
         if '.' in key:
             root_key = key.split('.')[0]
-            cursor.execute("SELECT value FROM player WHERE key = ?", (root_key,))
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute("SELECT key FROM player")
-                available = [r[0] for r in cursor.fetchall()]
+            if root_key not in _state():
+                available = list(_state().keys())
                 return {"success": False, "error": f"Root key '{root_key}' not found.", "available_keys": available, "key": key}
 
-            data = json.loads(row[0])
+            data = _db_val(cursor, root_key)
             path_in_obj = key[len(root_key)+1:]
             current_list = get_nested_value(data, path_in_obj)
 
             if current_list is None or not isinstance(current_list, list):
                 return {"success": False, "error": f"Key '{key}' not found or is not a list.", "available_nested_keys": list(data.keys()), "key": key}
         else:
-            cursor.execute("SELECT value FROM player WHERE key = ?", (key,))
-            row = cursor.fetchone()
-            if not row:
-                cursor.execute("SELECT key FROM player")
-                available = [r[0] for r in cursor.fetchall()]
+            if key not in _state():
+                available = list(_state().keys())
                 return {"success": False, "error": f"Key '{key}' not found in database.", "available_keys": available, "key": key}
-            try:
-                current_list = json.loads(row[0])
-            except (json.JSONDecodeError, TypeError):
-                current_list = [row[0]]
+            current_list = _db_val(cursor, key)
+            if isinstance(current_list, str):
+                current_list = [current_list]
 
         is_prepared_spells = (key == "spellcasting.spells_prepared")
 
@@ -846,7 +2158,7 @@ def update_player_list(key: str, item: str, action: str) -> dict:
                         reverted[entry["field"]] = {"delta": -entry["delta"]}
                     del buff_data_raw[item]
                     _db_set(cursor, "_active_buff_data", buff_data_raw)
-                    DB_CONNECTION.commit()
+                    _db_set(cursor, key, current_list)
                     result_early = {
                         "success": True,
                         "key": key,
@@ -861,11 +2173,10 @@ def update_player_list(key: str, item: str, action: str) -> dict:
 
         if '.' in key:
             set_nested_value(data, path_in_obj, current_list)
-            cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (root_key, json.dumps(data)))
+            _db_set(cursor, root_key, data)
         else:
-            cursor.execute("INSERT OR REPLACE INTO player (key, value) VALUES (?, ?)", (key, json.dumps(current_list)))
+            _db_set(cursor, key, current_list)
 
-        DB_CONNECTION.commit()
 
         display_list = []
         for e in current_list:
@@ -889,39 +2200,272 @@ def update_player_list(key: str, item: str, action: str) -> dict:
 
         return result
     except Exception as e:
+        _fail_unit()
         return {"success": False, "error": f"Error updating list: {str(e)}", "key": key}
 
 
-@mcp.tool()
-def dump_player_db() -> dict:
+@_game_tool
+def open_session(player_file: str, session_db: bool = True) -> dict:
     """
-    Returns a full dump of the current in-memory player database for state refresh.
+    Loads a .player file into this client's session. Used by the engine when it connects to a shared
+    server over HTTP/SSE — the GM never needs to call it.
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. Each client connection has its own database, combat registry and journal; opening a session
+       never affects other games served by the same process.
+    2. player_file must lie inside the server's player root (the output/ directory by default).
+    3. With session_db=True an existing <name>.session.db for the file is resumed, exactly as with
+       the --session-db flag under stdio.
+    4. If another live session already has that session DB open (e.g. this client reconnected before
+       its old session closed), its database, combat registry and journal move to this session and
+       the old session is left empty. A session DB never has two writers.
+    """
+    root = os.path.realpath(PLAYER_ROOT)
+    path = os.path.realpath(player_file)
+    if os.path.commonpath([root, path]) != root:
+        return {"success": False, "error": f"Player file must be inside {PLAYER_ROOT}/.", "player_file": player_file}
+
+    owner = _session_db_owner(_session_db_path(path)) if session_db else None
+    if owner is not None:
+        _take_over_session(owner)
+        if _session_is_current(path):
+            return {"success": True, "status": f"Took over the live session on {SESSION_DB_PATH}.",
+                    "player_file": player_file}
+    status = init_player_db(path, session_db=session_db)
+    if status.startswith("Failed"):
+        return {"success": False, "error": status, "player_file": player_file}
+    return {"success": True, "status": status, "player_file": player_file}
+
+
+@_game_tool
+def dump_player_db(since_version: int | None = None, fields: list[str] | None = None) -> dict:
+    """
+    Returns a dump of the current player database for state refresh.
+
+    PARAMETERS:
+    - since_version: the "_version" from an earlier dump. When given, only the top-level keys that
+      changed after that version are returned (plus "_removed" for deleted keys). Omit for the
+      full sheet.
+    - fields: optional list of keys or dotted paths to return instead of the whole sheet
+      (e.g. ["name", "current_hit_points", "stats.dex", "spellcasting.slots"]).
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. Every dump carries "_version", the current state version. Keep it for the next sync.
+    2. A delta dump also carries "_since_version". Merge its keys over your previous copy.
+    3. If since_version is unknown (newer than the current version), the full sheet is returned
+       without "_since_version".
+    4. With fields, the result is keyed by the requested path exactly as given. Paths that do not
+       exist are listed in "_missing". Combined with since_version, only requested paths whose
+       top-level key changed are returned.
+
+    EXAMPLES:
+    dump_player_db()
+    dump_player_db(since_version=42)
+    dump_player_db(fields=["current_hit_points", "total_hit_points", "spellcasting.slots"])
     """
     global DB_CONNECTION
     if DB_CONNECTION is None:
         return {"error": "Database not initialized."}
 
     try:
-        cursor = DB_CONNECTION.cursor()
-        cursor.execute("SELECT * FROM player")
-        rows = cursor.fetchall()
+        state = _state()
+        if fields is not None:
+            delta = since_version is not None and since_version <= _STATE_VERSION
+            result, missing = {}, []
+            for field in fields:
+                if delta and _KEY_VERSIONS.get(field.split('.', 1)[0], 0) <= since_version:
+                    continue
+                value = get_nested_value(state, field)
+                if value is None:
+                    missing.append(field)
+                else:
+                    result[field] = value
+            if missing:
+                result["_missing"] = missing
+            if delta:
+                result["_since_version"] = since_version
+        elif since_version is None or since_version > _STATE_VERSION:
+            result = dict(state)
+        else:
+            changed = [key for key, version in _KEY_VERSIONS.items() if version > since_version]
+            result = {key: state[key] for key in changed if key in state}
+            removed = [key for key in changed if key not in state]
+            if removed:
+                result["_removed"] = removed
+            result["_since_version"] = since_version
+        result["_version"] = _STATE_VERSION
+        return result
+    except Exception as e:
+        return {"error": f"Error dumping database: {str(e)}"}
 
-        if not rows:
-            return {}
 
-        result = {}
-        for key, value in rows:
-            try:
-                result[key] = json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                result[key] = value
+@_game_tool
+def save_player() -> dict:
+    """
+    Exports the current character sheet to the .player file. Used by the engine's /save command —
+    the GM never needs to call it.
 
-        return result
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. Active effects are not saved: each buff's field change is reverted in the exported sheet and
+       active_effects / _active_buff_data are written empty. The running session keeps its buffs.
+    2. The file is replaced atomically, so an interrupted save never leaves a truncated sheet.
+    3. With a session database the state is already durable on disk; the save also checkpoints its
+       WAL and marks the session as current for the new .player file.
+    """
+    if DB_CONNECTION is None or PLAYER_FILE_PATH is None:
+        return {"success": False, "error": "Database not initialized."}
+
+    try:
+        sheet = copy.deepcopy(_state())
+        cleared = []
+        for spell_name, entries in sheet.get("_active_buff_data", {}).items():
+            for entry in entries:
+                field = entry["field"]
+                if field == "temporary_hit_points":
+                    sheet[field] = 0
+                    continue
+                current_val = sheet.get(field, 0)
+                if isinstance(current_val, str):
+                    try:
+                        current_val = int(current_val)
+                    except (ValueError, TypeError):
+                        continue
+                sheet[field] = current_val - entry["delta"]
+            cleared.append(spell_name)
+        sheet["active_effects"] = []
+        sheet["_active_buff_data"] = {}
+
+        tmp_path = PLAYER_FILE_PATH + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(sheet, f, indent=2)
+        os.replace(tmp_path, PLAYER_FILE_PATH)
+
+        _write_session_meta()
+        DB_CONNECTION.commit()
+        if SESSION_DB_PATH:
+            DB_CONNECTION.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+        return {"success": True, "path": PLAYER_FILE_PATH, "reverted_effects": cleared}
     except Exception as e:
-        return {"error": f"Error dumping database: {str(e)}"}
+        _fail_unit()
+        return {"success": False, "error": f"Error saving character sheet: {str(e)}"}
 
 
-@mcp.tool()
+@_game_tool
+def undo_last_action(steps: int = 1) -> dict:
+    """
+    Reverts the most recent state-changing tool call(s). Use it to fix a GM mistake (wrong target,
+    wrong amount, duplicate call) instead of reversing the change by hand.
+
+    PARAMETERS:
+    - steps: how many state-changing tool calls to revert, newest first (default 1).
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. Restores the player database exactly as it was before those calls — HP, spell slots, XP,
+       level-ups, inventory, gold, effects — and reverts combat registry HP, kills and registrations.
+    2. Calls that changed nothing (rolls, checks, dumps) are skipped and do not count as a step.
+    3. Undo itself cannot be undone; calling it again reverts the next older action.
+    4. Nothing is re-rolled. After undoing, issue the correct tool call and narrate from its result.
+
+    EXAMPLES:
+    undo_last_action()
+    undo_last_action(steps=2)
+    """
+    if DB_CONNECTION is None:
+        return {"success": False, "error": "Database not initialized."}
+    if steps < 1:
+        return {"success": False, "error": "steps must be at least 1."}
+
+    units = [row[0] for row in DB_CONNECTION.execute(
+        "SELECT DISTINCT unit FROM journal WHERE undone = 0 AND (tool IS NULL OR tool NOT IN (?, ?)) "
+        "ORDER BY unit DESC LIMIT ?", _UNDO_TOOLS + (steps,)
+    )]
+    if not units:
+        return {"success": False, "error": "Nothing to undo."}
+
+    undone = _undo_units(units)
+    narrative = "Undone: " + "; ".join(f"{u['tool']} ({', '.join(u['changed'])})" for u in undone)
+    return {"success": True, "undone": undone, "narrative_format": narrative}
+
+
+def _undo_units(units: list[int]) -> list[dict]:
+    """Revert the given journal units (player rows and registry) and mark them undone; returns what changed, newest first."""
+    marks = ",".join("?" * len(units))
+    events = DB_CONNECTION.execute(
+        f"SELECT seq, unit, tool, path, old FROM journal WHERE unit IN ({marks}) ORDER BY seq", units
+    ).fetchall()
+
+    cursor = DB_CONNECTION.cursor()
+    state = _state()
+    target_state, _ = _unflatten_rows(_journal_rows_at(events[0][0] - 1))
+    for root in [r for r in state if r not in target_state]:
+        del state[root]
+        _STATE_DIRTY.add(root)
+    for root, value in target_state.items():
+        if state.get(root) != value:
+            _db_set(cursor, root, value)
+
+    for seq, unit, tool, path, old in reversed(events):
+        if path.startswith(_REGISTRY_PATH):
+            _journal_registry(path, _registry_value(path), json.loads(old))
+            _apply_registry_value(path, old)
+
+    DB_CONNECTION.execute(f"UPDATE journal SET undone = 1 WHERE unit IN ({marks})", units)
+
+    undone = {}
+    for seq, unit, tool, path, old in events:
+        entry = undone.setdefault(unit, {"tool": tool or "direct", "changed": []})
+        field = path.replace(_PATH_SEP, ".")
+        if field not in entry["changed"]:
+            entry["changed"].append(field)
+    return [undone[u] for u in sorted(undone, reverse=True)]
+
+
+@_game_tool
+def rollback_combat(round: int) -> dict:
+    """
+    Rewinds the fight to the start of an earlier round: combat registry (HP, kills, conditions,
+    turn order, timed effects) and the player's HP, temporary HP, spell slots, effects and XP.
+
+    PARAMETERS:
+    - round: the round to return to. Its first turn is the current turn again afterwards.
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. A snapshot is taken when each round starts (register_combatants starts round 1, next_turn
+       the later ones). Rolling back restores exactly that state — nothing is re-rolled.
+    2. Everything done after that point is reverted, including loot or items used mid-fight.
+    3. Use undo_last_action for one wrong call; use this when a misapplied hit has already been
+       carried through several turns.
+
+    EXAMPLES:
+    rollback_combat(round=3)
+    """
+    if DB_CONNECTION is None:
+        return {"success": False, "error": "Database not initialized."}
+    marks = dict(_COMBAT_REGISTRY.round_marks)
+    if round not in marks:
+        return {"success": False, "error": f"No snapshot for round {round}.",
+                "available_rounds": sorted(marks), "hint": "Round snapshots are taken by register_combatants and next_turn."}
+
+    units = [row[0] for row in DB_CONNECTION.execute(
+        "SELECT DISTINCT unit FROM journal WHERE undone = 0 AND unit > ? AND (tool IS NULL OR tool NOT IN (?, ?)) "
+        "ORDER BY unit DESC", (marks[round],) + _UNDO_TOOLS
+    )]
+    undone = _undo_units(units) if units else []
+    current = _COMBAT_REGISTRY.current()
+    narrative = f"Combat rolled back to the start of round {round}"
+    narrative += f" — {current.name}'s turn." if current else "."
+    return {
+        "success": True,
+        "round": _COMBAT_REGISTRY.round,
+        "current_turn": current.name if current else None,
+        "calls_reverted": len(undone),
+        "undone": undone,
+        "narrative_format": narrative,
+    }
+
+
+@_game_tool
 def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
     """
     Applies a short or long rest. All numeric changes auto-applied to the database.
@@ -1005,7 +2549,6 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
             if dice_spent > 0:
                 hp_result = _apply_hp_change(cursor, total_healing)
                 _db_set(cursor, "hit_dice_count", str(new_hd))
-                DB_CONNECTION.commit()
                 changes["hp"] = {"old": current_hp, "new": hp_result["new_value"],
                                  "healed": total_healing, "dice_spent": dice_spent,
                                  "status": hp_result["hp_status"]}
@@ -1021,7 +2564,6 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
             if caster_type == "warlock" and slot_table:
                 sc["slots"] = {str(k): v for k, v in slot_table.items()}
                 _db_set(cursor, "spellcasting", sc)
-                DB_CONNECTION.commit()
                 changes["slots_restored"] = {str(k): v for k, v in slot_table.items()}
 
             if char_class == "Wizard" and caster_type == "full":
@@ -1050,7 +2592,6 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
 
                 if recovered:
                     _db_set(cursor, "spellcasting", sc)
-                    DB_CONNECTION.commit()
                     changes["arcane_recovery"] = {
                         "recovered": recovered,
                         "budget_used": budget_used,
@@ -1090,13 +2631,11 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
             hd_regained = max(level // 2, 1)
             new_hd = min(hd_count + hd_regained, level)
             _db_set(cursor, "hit_dice_count", str(new_hd))
-            DB_CONNECTION.commit()
             changes["hit_dice"] = {"old": hd_count, "new": new_hd, "regained": hd_regained}
 
             if slot_table:
                 sc["slots"] = {str(k): v for k, v in slot_table.items()}
                 _db_set(cursor, "spellcasting", sc)
-                DB_CONNECTION.commit()
                 changes["slots_restored"] = {str(k): v for k, v in slot_table.items()}
                 if caster_type == "warlock":
                     changes["slots_restored"] = {"pact_magic": {str(k): v for k, v in slot_table.items()}}
@@ -1109,7 +2648,6 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
                 effects_cleared.append(spell_name)
             _db_set(cursor, "active_effects", [])
             _db_set(cursor, "_active_buff_data", {})
-            DB_CONNECTION.commit()
             if effects_cleared:
                 changes["effects_cleared"] = effects_cleared
 
@@ -1143,7 +2681,6 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
                                             for s in sc.get("spells_prepared", [])]
                             sc["spells_prepared"] = [{"name": s} for s in prepared_spells]
                             _db_set(cursor, "spellcasting", sc)
-                            DB_CONNECTION.commit()
                             changes["prepared_spells"] = {
                                 "old": old_prepared,
                                 "new": list(prepared_spells),
@@ -1155,7 +2692,6 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
                                         for s in sc.get("spells_prepared", [])]
                         sc["spells_prepared"] = [{"name": s} for s in prepared_spells]
                         _db_set(cursor, "spellcasting", sc)
-                        DB_CONNECTION.commit()
                         changes["prepared_spells"] = {
                             "old": old_prepared,
                             "new": list(prepared_spells),
@@ -1194,42 +2730,43 @@ def rest(rest_type: str, prepared_spells: list[str] | None = None) -> dict:
         return result
 
     except Exception as e:
+        _fail_unit()
         return {"success": False, "error": f"Error applying rest: {str(e)}"}
 
 
-@mcp.tool()
+@_game_tool
 def roll_dice(dice_notation: str, modifier: int = 0, actor: str = "{player_name}") -> dict:
     """
     Rolls dice for damage, healing, loot quantity, or any random magnitude.
 
     PARAMETERS:
-    - dice_notation: dice only (e.g. '3d4'), do NOT include modifiers in this string
+    - dice_notation: dice expression (e.g. '3d4', '2d6+1d4', '4d6kh3' keep highest 3, '2d20kl1' keep lowest,
+      '2d6r2' reroll 1s and 2s once). Prefer passing flat bonuses via modifier.
     - modifier: flat bonus/penalty to add to the roll total
     - actor: who is rolling — character name for player, NPC/creature name for NPCs
 
     RULES:
     - Use this for "how much?" scenarios only. For success/failure checks, use perform_check.
-    - Include the 'narrative_format' field from the response verbatim when disclosing results.
+    - Include the narrative ('n'; 'narrative_format' in verbose responses) verbatim when disclosing results.
 
     EXAMPLES:
     roll_dice(actor='Senna', dice_notation='3d4', modifier=3)
     roll_dice(actor='Goblin Brute', dice_notation='1d6', modifier=2)
+    roll_dice(actor='Senna', dice_notation='4d6kh3')
     """
     try:
         if actor == "{player_name}" and DB_CONNECTION is not None:
             actor = _db_val(DB_CONNECTION.cursor(), "name", "Player")
 
-        parts = dice_notation.lower().split('d')
-        if len(parts) != 2:
-            return {"error": "Invalid dice notation. Use format 'XdY' (e.g., '2d6')."}
+        expr = _compile_dice(dice_notation)
+        if expr is None:
+            return {"error": "Invalid dice notation. Use format 'XdY' (e.g., '2d6', '4d6kh3', '2d6+1d4')."}
 
-        num_dice = int(parts[0]) if parts[0] else 1
-        die_size = int(parts[1])
-
-        if num_dice <= 0 or die_size <= 0:
+        if not expr.terms:
             return {"error": "Number of dice and die size must be positive integers."}
 
-        rolls = [random.randint(1, die_size) for _ in range(num_dice)]
+        rolls = _roll_dice_expr(expr)
+        modifier += expr.flat
         total = sum(rolls) + modifier
 
         rolls_str = " + ".join(str(r) for r in rolls)
@@ -1250,7 +2787,111 @@ def roll_dice(dice_notation: str, modifier: int = 0, actor: str = "{player_name}
         return {"error": "Invalid dice notation. Please provide integers (e.g., '2d6')."}
 
 
-@mcp.tool()
+# Batch draws are taken up front into one unsigned array, so every entry must fit it.
+BATCH_MAX_DIE_SIZE = 1_000_000
+BATCH_MAX_DICE = 1000  # dice per entry
+
+
+def _batch_entry_error(expr: _DiceExpr | None) -> str | None:
+    """Why a roll_dice_batch entry cannot be rolled, or None."""
+    if expr is None or not expr.terms:
+        return "Invalid dice notation."
+    if max(term.size for term in expr.terms) > BATCH_MAX_DIE_SIZE:
+        return f"Die size must be at most {BATCH_MAX_DIE_SIZE}."
+    if sum(term.count for term in expr.terms) > BATCH_MAX_DICE:
+        return f"One entry rolls at most {BATCH_MAX_DICE} dice."
+    return None
+
+
+@_game_tool
+def roll_dice_batch(rolls: list[dict]) -> dict:
+    """
+    Rolls many independent dice expressions in ONE call (group checks, mob initiative, NPC hit dice, loot).
+
+    PARAMETERS:
+    - rolls: list of roll dicts with fields:
+      - notation (str, required): dice expression, same syntax as roll_dice (e.g. '1d20', '2d6+1d4', '4d6kh3')
+      - modifier (int, optional, default 0): flat bonus/penalty
+      - actor (str, optional): who is rolling — defaults to the player
+      - label (str, optional): what the roll is for (e.g. 'Stealth', 'Initiative')
+
+    RULES:
+    - Use this instead of several roll_dice calls whenever the rolls do not depend on each other.
+    - An invalid entry is reported in its own result; the other rolls still resolve.
+    - Each entry rolls at most 1000 dice of at most 1000000 sides; use roll_dice beyond that.
+    - Include the narrative ('n'; 'narrative_format' in verbose responses) verbatim when disclosing results.
+
+    EXAMPLES:
+    roll_dice_batch(rolls=[
+        {"notation": "1d20", "modifier": 2, "actor": "Goblin 1", "label": "Stealth"},
+        {"notation": "1d20", "modifier": 2, "actor": "Goblin 2", "label": "Stealth"},
+        {"notation": "2d6", "actor": "Bandit Chest", "label": "Gold"},
+    ])
+    """
+    if not rolls:
+        return {"error": "No rolls provided.", "hint": "Pass a list of {'notation': 'XdY', 'modifier': N, 'actor': str} dicts."}
+
+    player_name = None
+    entries = []
+    sizes = array("L")
+    for entry in rolls:
+        if not isinstance(entry, dict):
+            entries.append(({}, None, f"Roll entry must be a dict, got {type(entry).__name__}."))
+            continue
+        expr = _compile_dice(str(entry.get("notation", "")))
+        error = _batch_entry_error(expr)
+        if error is None:
+            for term in expr.terms:
+                sizes.extend(array("L", [term.size]) * term.count)
+        entries.append((entry, expr, error))
+
+    rand = random.random
+    draws = array("L", [int(rand() * size) + 1 for size in sizes])
+
+    results = []
+    narrative_parts = []
+    pos = 0
+    for i, (entry, expr, error) in enumerate(entries):
+        notation = entry.get("notation", "")
+        actor = entry.get("actor") or "{player_name}"
+        if actor == "{player_name}":
+            if player_name is None:
+                player_name = _db_val(DB_CONNECTION.cursor(), "name", "Player") if DB_CONNECTION is not None else "Player"
+            actor = player_name
+        label = entry.get("label", "")
+
+        if error:
+            results.append({"i": i, "actor": actor, "notation": notation, "error": error})
+            narrative_parts.append(f"{actor} {notation}: {error[0].lower()}{error[1:].rstrip('.')}")
+            continue
+
+        try:
+            modifier = int(entry.get("modifier", 0)) + expr.flat
+        except (ValueError, TypeError):
+            modifier = expr.flat
+
+        entry_rolls = []
+        for term in expr.terms:
+            entry_rolls.extend(_finish_dice_term(term, list(draws[pos:pos + term.count])))
+            pos += term.count
+        total = sum(entry_rolls) + modifier
+
+        results.append({"i": i, "actor": actor, "notation": notation, "rolls": entry_rolls, "modifier": modifier, "total": total})
+
+        rolls_str = " + ".join(str(r) for r in entry_rolls)
+        label_str = f" {label}" if label else ""
+        if modifier != 0:
+            narrative_parts.append(f"{actor}{label_str} {notation}: {total} ({rolls_str} + {modifier})")
+        else:
+            narrative_parts.append(f"{actor}{label_str} {notation}: {total} ({rolls_str})")
+
+    return {
+        "results": results,
+        "narrative_format": "\n".join(narrative_parts),
+    }
+
+
+@_game_tool
 def perform_check(modifier: int, dc: int, check_name: str = "Check", actor: str = "{player_name}") -> dict:
     """
     Performs a skill check or saving throw (d20 + modifier vs DC).
@@ -1264,7 +2905,7 @@ def perform_check(modifier: int, dc: int, check_name: str = "Check", actor: str
     RULES:
     - For weapon/unarmed attacks, use resolve_attack instead.
     - For spell attacks, use resolve_magic.
-    - Include the 'narrative_format' field from the response verbatim when disclosing results.
+    - Include the narrative ('n'; 'narrative_format' in verbose responses) verbatim when disclosing results.
 
     EXAMPLES:
     perform_check(actor='Thorin', modifier=5, dc=15, check_name='Athletics')
@@ -1302,47 +2943,191 @@ def perform_check(modifier: int, dc: int, check_name: str = "Check", actor: str
     return response
 
 
+def _match_combatant(name: str) -> tuple[str | None, list]:
+    entry = _COMBAT_REGISTRY.member(name)
+    if entry is not None:
+        return entry.name, []
+    return _match_name(_COMBAT_REGISTRY.fuzzy_index(), name)
+
+
+def _resolve_target_names(target_name: str, targets: list[dict] | None, target_current_hp: int | None) -> tuple[str, dict | None]:
+    """
+    Maps near-miss target names onto registered combatants before anything is rolled.
+    Returns (target_name, None), or (target_name, error) when a name without a given HP is
+    ambiguous between registered combatants.
+    """
+    if not _COMBAT_REGISTRY:
+        return target_name, None
+    checks = []
+    if target_name and target_name != "{player_name}":
+        checks.append((target_name, target_current_hp is not None, None))
+    for t in targets or []:
+        if t.get("name") and t["name"] != "{player_name}":
+            checks.append((t["name"], "current_hp" in t, t))
+    for name, has_hp, target in checks:
+        resolved, suggestions = _match_combatant(name)
+        if resolved is not None:
+            if target is None:
+                target_name = resolved
+            else:
+                target["name"] = resolved
+        elif suggestions and not has_hp:
+            return target_name, {
+                "success": False,
+                "error": f"'{name}' is not in the combat registry.",
+                "suggestions": suggestions,
+                "hint": "Use the registered name, or add it with register_combatants(add_to_existing=True).",
+            }
+    return target_name, None
+
+
 def _registry_hp(target_name: str) -> int | None:
-    entry = _COMBAT_REGISTRY.get(target_name)
+    entry = _COMBAT_REGISTRY.lookup(target_name)
     if entry:
-        return entry["current_hp"]
+        return entry.current_hp
+    group = _COMBAT_REGISTRY.troop(target_name)
+    if group:
+        front = group.front()
+        return group.hp[front] if front is not None else 0
     return None
 
 
 def _registry_ac(target_name: str) -> int | None:
-    entry = _COMBAT_REGISTRY.get(target_name)
+    entry = _COMBAT_REGISTRY.member(target_name)
     if entry:
-        return entry["ac"]
+        return entry.ac
     return None
 
 
 def _registry_update_hp(target_name: str, new_hp: int):
-    entry = _COMBAT_REGISTRY.get(target_name)
+    entry = _COMBAT_REGISTRY.lookup(target_name)
     if entry:
-        entry["current_hp"] = new_hp
+        _journal_registry(_registry_path(entry.name, "current_hp"), entry.current_hp, new_hp)
+        entry.current_hp = new_hp
+        return
+    group = _COMBAT_REGISTRY.troop(target_name)
+    front = group.front() if group else None
+    if front is not None:
+        old = list(group.hp)
+        group.hp[front] = min(max(new_hp, 0), group.troop_hp)
+        _journal_registry(_registry_path(group.name, "hp"), old, list(group.hp))
 
 
 def _registry_kill(target_name: str):
-    entry = _COMBAT_REGISTRY.get(target_name)
+    entry = _COMBAT_REGISTRY.lookup(target_name)
     if entry:
-        entry["killed"] = True
+        _journal_registry(_registry_path(entry.name, "killed"), entry.killed, True)
+        entry.killed = True
 
 
 def _registry_cr(target_name: str) -> float | None:
-    entry = _COMBAT_REGISTRY.get(target_name)
+    entry = _COMBAT_REGISTRY.member(target_name)
     if entry:
-        return entry.get("challenge_rating")
+        return entry.challenge_rating
     return None
 
 
 def _registry_max_hp(target_name: str) -> int:
-    entry = _COMBAT_REGISTRY.get(target_name)
+    entry = _COMBAT_REGISTRY.lookup(target_name)
     if entry:
-        return entry["max_hp"]
+        return entry.max_hp
+    group = _COMBAT_REGISTRY.troop(target_name)
+    if group:
+        return group.troop_hp
     return 0
 
 
-@mcp.tool()
+def _registry_condition(target_name: str, condition: str, duration: str | None, caster: str | None) -> dict | None:
+    """Mark a registered combatant with a condition and, if its duration is timed, schedule its end."""
+    entry = _COMBAT_REGISTRY.member(target_name)
+    if entry is None or not condition:
+        return None
+    before, conditions_before = _COMBAT_REGISTRY.schedule_state(), list(entry.conditions)
+    if condition not in entry.conditions:
+        entry.conditions.append(condition)
+        _journal_conditions(entry, conditions_before)
+    _COMBAT_REGISTRY.cancel(entry.name, condition)
+    rounds = _duration_rounds(duration)
+    ends = _COMBAT_REGISTRY.schedule(entry.name, condition, rounds, caster, "condition") if rounds else None
+    _journal_schedule(before)
+    info = {"name": entry.name, "condition": condition}
+    if ends:
+        info["ends"] = {"round": ends[0], "turn": ends[1]}
+    return info
+
+
+def _schedule_player_effect(effect: str, duration: str | None, caster: str | None) -> tuple | None:
+    """Schedule a player active effect to be removed (and its buffs reverted) when its duration runs out."""
+    player = next((e for e in _COMBAT_REGISTRY.values() if e.is_player), None)
+    rounds = _duration_rounds(duration)
+    if player is None or not rounds:
+        return None
+    before = _COMBAT_REGISTRY.schedule_state()
+    ends = _COMBAT_REGISTRY.schedule(player.name, effect, rounds, caster or player.name, "effect")
+    if ends:
+        _journal_schedule(before)
+    return ends
+
+
+def _expand_monster_templates(combatants: list[dict], taken: set) -> tuple[list[dict], list, dict | None]:
+    """
+    Replace {"template": ..., "count": N} entries with N combatant dicts from the monster catalog.
+    Returns (combatants, [(monster name, [registered names])], error or None). `taken` holds the
+    normalized names already in use and receives the new ones.
+    """
+    catalog = _monster_catalog()
+    taken.update(_normalize_name(c["name"]) for c in combatants if "template" not in c and "name" in c)
+    expanded, expansions = [], []
+    for c in combatants:
+        if "template" not in c:
+            expanded.append(c)
+            continue
+        key = str(c["template"]).lower().strip()
+        monster = catalog["monsters"].get(key)
+        if monster is None:
+            key, suggestions = _match_name(catalog["names"], c["template"])
+            if key is None:
+                error = {"success": False, "error": f"No monster template named '{c['template']}'."}
+                if suggestions:
+                    error["suggestions"] = [catalog["monsters"][k]["name"] for k in suggestions]
+                return combatants, [], error
+            monster = catalog["monsters"][key]
+        base = {field: monster[field] for field in MONSTER_TEMPLATE_FIELDS if field in monster}
+        base.update((k, v) for k, v in c.items() if k not in ("template", "count", "roll_hp"))
+        label = base.pop("name", None) or monster["name"]
+        if c.get("troops"):
+            copies, names = 1, [label]
+        else:
+            copies = c.get("count", 1)
+            if isinstance(copies, bool) or not isinstance(copies, int) or not 1 <= copies <= MONSTER_TEMPLATE_MAX_COUNT:
+                return combatants, [], {
+                    "success": False,
+                    "error": f"count for template '{monster['name']}' must be a whole number from 1 to "
+                             f"{MONSTER_TEMPLATE_MAX_COUNT}, got {copies!r}.",
+                    "hint": "For larger bodies of identical creatures use \"troops\": N instead of count.",
+                }
+            names = []
+            if copies == 1 and not taken & {_normalize_name(label), _normalize_name(f"{label} 1")}:
+                names.append(label)
+            number = 1
+            while len(names) < copies:
+                if _normalize_name(f"{label} {number}") not in taken:
+                    names.append(f"{label} {number}")
+                number += 1
+            if copies > 1:
+                base.pop("aliases", None)
+        for name in names:
+            entry = dict(base, name=name)
+            if c.get("roll_hp") and "hp" not in c and not c.get("troops"):
+                _, _, rolled = _parse_and_roll_dice(monster.get("hit_dice", monster["hp"]))
+                entry["hp"] = max(1, rolled)
+            taken.add(_normalize_name(name))
+            expanded.append(entry)
+        expansions.append((monster["name"], names))
+    return expanded, expansions, None
+
+
+@_game_tool
 def register_combatants(combatants: list[dict], add_to_existing: bool = False) -> dict:
     """
     Registers all combatants for a battle and rolls initiative for everyone. Player is auto-registered.
@@ -1355,6 +3140,16 @@ def register_combatants(combatants: list[dict], add_to_existing: bool = False) -
       - initiative_modifier (int, required unless add_to_existing=True): DEX modifier
       - challenge_rating (float, optional): CR for XP awards
       - save_modifier (int, optional, default 0): generic save bonus
+      - aliases (list[str], optional): other names the GM may use for it (e.g. ["the captain"])
+      - troops (int, optional): register a block of this many identical troops under one name
+        (mass combat). hp is per troop; the group rolls one initiative and acts on one turn.
+    - Or a monster template entry: {"template": "Goblin", "count": 6} registers Goblin 1..Goblin 6
+      with SRD stats (hp, ac, initiative_modifier, challenge_rating, save_modifier) from
+      config/monsters.yml. Optional keys:
+      - count (int, default 1, at most 100): how many copies; use troops for larger groups
+      - name (str): base name for the copies instead of the template name
+      - roll_hp (bool, default False): roll each copy's hit dice instead of using average HP
+      - any combatant field above (hp, ac, aliases, troops...) overrides the template value
     - add_to_existing (bool, default False): if True, adds to existing registry without wiping it.
       No initiative rolled for new arrivals. Use for mid-combat reinforcements or forgotten combatants.
       Existing HP states are preserved.
@@ -1363,17 +3158,40 @@ def register_combatants(combatants: list[dict], add_to_existing: bool = False) -
     1. Resolve_attack and resolve_magic auto-lookup target HP from the registry — no need to pass
        target_current_hp on every call. HP is carried forward between hits automatically.
     2. Calling this again without add_to_existing overwrites the registry entirely.
+    3. Names and aliases are matched ignoring case and spacing: 'goblin 1' finds 'Goblin 1'.
+    4. Combat starts at round 1 with the top of the initiative order; call next_turn to advance.
+       Reinforcements added with add_to_existing act last in each round.
+    5. Troop groups (mass combat): pass the group name in resolve_magic targets to catch all of its
+       standing troops in an area ({"name": "Zarthus Pikemen", "count": 20} for only 20 of them).
+       Saves and damage resolve for the whole group at once and come back as one summary line.
+       A resolve_attack on the group name hits its first troop still standing.
+    6. Template copies are numbered after any names already taken: adding {"template": "Goblin",
+       "count": 2} with add_to_existing=True while Goblin 1-3 exist registers Goblin 4 and Goblin 5.
+       Template names are matched loosely ('hob goblin' -> Hobgoblin); an unknown template returns
+       suggestions and registers nothing.
 
     EXAMPLES:
     register_combatants(combatants=[
         {"name": "Scarred Half-Orc", "hp": 15, "ac": 14, "initiative_modifier": 1,
-         "challenge_rating": 1, "save_modifier": 1},
+         "challenge_rating": 1, "save_modifier": 1, "aliases": ["the half-orc"]},
         {"name": "Crossbow Bandit 1", "hp": 11, "ac": 12, "initiative_modifier": 2,
          "challenge_rating": 0.125},
         {"name": "Kella", "hp": 30, "ac": 15, "initiative_modifier": 2},
         {"name": "Harlen Dregg", "hp": 30, "ac": 16, "initiative_modifier": 0},
     ])
 
+    register_combatants(combatants=[
+        {"name": "Zarthus Pikemen", "hp": 11, "ac": 13, "initiative_modifier": 1,
+         "challenge_rating": 0.125, "save_modifier": 1, "troops": 120},
+        {"name": "Warlord Zarthus", "hp": 65, "ac": 17, "initiative_modifier": 2, "challenge_rating": 5},
+    ])
+
+    register_combatants(combatants=[
+        {"template": "Goblin", "count": 6},
+        {"template": "Bugbear", "name": "Klarg", "roll_hp": True, "aliases": ["the bugbear chief"]},
+        {"template": "Wolf", "count": 2, "ac": 14},
+    ])
+
     register_combatants(combatants=[
         {"name": "Guard Reinforce 1", "hp": 11, "ac": 16},
         {"name": "Guard Reinforce 2", "hp": 11, "ac": 16},
@@ -1381,8 +3199,19 @@ def register_combatants(combatants: list[dict], add_to_existing: bool = False) -
     """
     global _COMBAT_REGISTRY, DB_CONNECTION
 
+    expansions = []
+    if any("template" in c for c in combatants):
+        taken = set()
+        if add_to_existing:
+            taken.update(_normalize_name(e.name) for e in _COMBAT_REGISTRY.values())
+            taken.update(_normalize_name(name) for name in _COMBAT_REGISTRY.troops)
+        combatants, expansions, error = _expand_monster_templates(combatants, taken)
+        if error is not None:
+            return error
+
+    previous_registry = _COMBAT_REGISTRY.to_dict()
     if not add_to_existing:
-        _COMBAT_REGISTRY = {}
+        _COMBAT_REGISTRY = _CombatRegistry()
 
     initiative_results = []
 
@@ -1398,23 +3227,16 @@ def register_combatants(combatants: list[dict], add_to_existing: bool = False) -
         player_max_hp = int(_db_val(cursor, "total_hit_points", 1))
         player_ac = int(_db_val(cursor, "armor_class", 10))
 
-        _COMBAT_REGISTRY[player_name] = {
-            "current_hp": player_hp,
-            "max_hp": player_max_hp,
-            "ac": player_ac,
-            "save_modifier": 0,
-            "challenge_rating": None,
-            "initiative_modifier": player_init_mod,
-            "initiative_roll": 0,
-            "initiative_total": 0,
-            "is_player": True,
-            "killed": False,
-        }
+        player_entry = _Combatant(
+            player_name, player_hp, player_max_hp, player_ac,
+            initiative_modifier=player_init_mod, is_player=True,
+        )
+        _COMBAT_REGISTRY.add(player_entry)
 
         player_d20 = random.randint(1, 20)
         player_init_total = player_d20 + player_init_mod
-        _COMBAT_REGISTRY[player_name]["initiative_roll"] = player_d20
-        _COMBAT_REGISTRY[player_name]["initiative_total"] = player_init_total
+        player_entry.initiative_roll = player_d20
+        player_entry.initiative_total = player_init_total
         initiative_results.append({
             "name": player_name,
             "roll": player_d20,
@@ -1435,24 +3257,24 @@ def register_combatants(combatants: list[dict], add_to_existing: bool = False) -
         else:
             init_mod = c["initiative_modifier"]
 
-        _COMBAT_REGISTRY[name] = {
-            "current_hp": max_hp,
-            "max_hp": max_hp,
-            "ac": ac,
-            "save_modifier": save_mod,
-            "challenge_rating": cr,
-            "initiative_modifier": init_mod,
-            "initiative_roll": 0,
-            "initiative_total": 0,
-            "is_player": False,
-            "killed": False,
-        }
+        if c.get("troops"):
+            entry = _TroopGroup(
+                name, int(c["troops"]), max_hp, ac, save_modifier=save_mod, challenge_rating=cr,
+                initiative_modifier=init_mod,
+            )
+            _COMBAT_REGISTRY.add_troops(entry)
+        else:
+            entry = _Combatant(
+                name, max_hp, max_hp, ac, save_modifier=save_mod, challenge_rating=cr,
+                initiative_modifier=init_mod, aliases=c.get("aliases") or (),
+            )
+            _COMBAT_REGISTRY.add(entry)
 
         if not add_to_existing:
             d20 = random.randint(1, 20)
             init_total = d20 + init_mod
-            _COMBAT_REGISTRY[name]["initiative_roll"] = d20
-            _COMBAT_REGISTRY[name]["initiative_total"] = init_total
+            entry.initiative_roll = d20
+            entry.initiative_total = init_total
             initiative_results.append({
                 "name": name,
                 "roll": d20,
@@ -1460,18 +3282,38 @@ def register_combatants(combatants: list[dict], add_to_existing: bool = False) -
                 "total": init_total,
                 "is_player": False,
             })
+            if isinstance(entry, _TroopGroup):
+                initiative_results[-1]["troops"] = entry.count
 
     registry_summary = []
-    for rname, entry in _COMBAT_REGISTRY.items():
+    for entry in _COMBAT_REGISTRY.values():
+        registry_summary.append({
+            "name": entry.name,
+            "hp": f"{entry.current_hp}/{entry.max_hp}",
+            "ac": entry.ac,
+            "initiative": entry.initiative_total,
+            "is_player": entry.is_player,
+        })
+    for group in _COMBAT_REGISTRY.troops.values():
         registry_summary.append({
-            "name": rname,
-            "hp": f"{entry['current_hp']}/{entry['max_hp']}",
-            "ac": entry["ac"],
-            "initiative": entry["initiative_total"],
-            "is_player": entry.get("is_player", False),
+            "name": group.name,
+            "troops": f"{group.standing}/{group.count} standing",
+            "hp_each": group.troop_hp,
+            "ac": group.ac,
+            "initiative": group.initiative_total,
+            "is_player": False,
         })
 
+    if not add_to_existing:
+        initiative_results.sort(key=lambda r: (-r["total"], r["name"]))
+        _COMBAT_REGISTRY.start([r["name"] for r in initiative_results])
+        _COMBAT_REGISTRY.mark_round(_JOURNAL_UNIT + 1)
+
+    _journal_registry(_registry_path(), previous_registry, _COMBAT_REGISTRY.to_dict())
+
     narrative_parts = [f"Combatants registered ({len(_COMBAT_REGISTRY)} total)."]
+    for monster_name, names in expansions:
+        narrative_parts.append(f"From {monster_name} template: {', '.join(names)}")
 
     if add_to_existing:
         added_names = [c["name"] for c in combatants]
@@ -1482,26 +3324,253 @@ def register_combatants(combatants: list[dict], add_to_existing: bool = False) -
             "narrative_format": "\n".join(narrative_parts),
         }
 
-    initiative_results.sort(key=lambda r: (-r["total"], r["name"]))
     order = [r["name"] for r in initiative_results]
 
     narrative_parts.append("Initiative Order:")
     for i, r in enumerate(initiative_results, 1):
-        tag = " (Player)" if r["is_player"] else ""
+        tag = " (Player)" if r["is_player"] else (f" ({r['troops']} troops)" if "troops" in r else "")
         narrative_parts.append(
             f"  {i}. {r['name']}{tag}: {r['total']} ({r['roll']} + {r['modifier']})"
         )
 
+    current = _COMBAT_REGISTRY.current()
+    if current is not None:
+        narrative_parts.append(f"Round 1 — {current.name}'s turn.")
+
     return {
         "success": True,
         "initiative": initiative_results,
         "initiative_order": order,
+        "round": _COMBAT_REGISTRY.round,
+        "current_turn": current.name if current else None,
         "registry_summary": registry_summary,
         "narrative_format": "\n".join(narrative_parts),
     }
 
 
-@mcp.tool()
+@_game_tool
+def next_turn() -> dict:
+    """
+    Ends the current combatant's turn and starts the next one in initiative order.
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. The registry tracks the round and whose turn it is. After the last combatant, a new round starts.
+    2. Killed NPCs are skipped. The player always gets a turn (death saves at 0 HP).
+    3. Timed effects end here automatically, at the start of the turn they expire on. This covers
+       spells the player cast on themselves (Shield, Bless, Shield of Faith...) and conditions that
+       resolve_magic or update_condition put on combatants. Expired player buffs are removed from
+       active_effects and their stat changes reverted — do NOT remove them by hand.
+    4. Narrate the effects that ended ("exp"; "expired" in verbose responses) to the player.
+
+    EXAMPLES:
+    next_turn()
+    """
+    if not len(_COMBAT_REGISTRY):
+        return {"success": False, "error": "No combat registry active.", "hint": "Call register_combatants first."}
+
+    before = _COMBAT_REGISTRY.schedule_state()
+    current = _COMBAT_REGISTRY.advance()
+    round_number = _COMBAT_REGISTRY.round
+    if round_number != before["round"]:
+        _COMBAT_REGISTRY.mark_round(_JOURNAL_UNIT + 1)
+    expired = []
+    narrative_parts = [f"Round {round_number} — {current.name}'s turn."]
+    for _, _, _, target, effect, kind in _COMBAT_REGISTRY.pop_expired():
+        if kind == "effect":
+            removal = update_player_list(key="active_effects", item=effect, action="remove")
+            if not removal.get("success"):
+                continue
+            expired.append({"name": target, "effect": effect, "reverted": removal.get("reverted", {})})
+        else:
+            entry = _COMBAT_REGISTRY.member(target)
+            if entry is None or effect not in entry.conditions:
+                continue
+            conditions_before = list(entry.conditions)
+            entry.conditions.remove(effect)
+            _journal_conditions(entry, conditions_before)
+            if isinstance(entry, _TroopGroup):
+                _set_troop_share(entry, effect, None)
+            expired.append({"name": target, "effect": effect})
+        narrative_parts.append(f"{effect} ends on {target}.")
+    _journal_schedule(before)
+
+    following = _COMBAT_REGISTRY.order[(_COMBAT_REGISTRY.turn + 1) % len(_COMBAT_REGISTRY.order)]
+    result = {
+        "success": True,
+        "round": round_number,
+        "current_turn": current.name,
+        "is_player": current.is_player,
+        "hp": (f"{current.standing}/{current.count} standing" if isinstance(current, _TroopGroup)
+               else f"{current.current_hp}/{current.max_hp}"),
+        "up_next": following,
+        "narrative_format": "\n".join(narrative_parts),
+    }
+    if current.conditions:
+        result["conditions"] = list(current.conditions)
+        if isinstance(current, _TroopGroup) and current.condition_shares():
+            result["affected"] = current.condition_shares()
+    if expired:
+        result["expired"] = expired
+    return result
+
+
+@_game_tool
+def update_condition(target_name: str, condition: str, action: str = "add", duration: str = "", caster: str = "") -> dict:
+    """
+    Adds or removes a condition on a registered combatant (player or NPC).
+
+    PARAMETERS:
+    - target_name: registered combatant
+    - condition: e.g. 'Stunned', 'Prone', 'Frightened'
+    - action: 'add' or 'remove'
+    - duration: for 'add', e.g. '1 round', '1 minute'. Timed conditions end automatically on next_turn.
+      Leave empty for conditions that last until removed.
+    - caster: whose turn the duration counts from (default: the current turn)
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. resolve_magic already adds the conditions of spells it resolves. Use this for weapon
+       effects, monster abilities, and conditions that end early (a successful repeat save).
+
+    EXAMPLES:
+    update_condition(target_name='Goblin 1', condition='Prone')
+    update_condition(target_name='{player_name}', condition='Poisoned', duration='1 minute', caster='Giant Spider')
+    update_condition(target_name='Ogre', condition='Paralyzed', action='remove')
+    """
+    condition = (condition or "").strip()
+    if not condition:
+        return {"success": False, "error": "condition must not be empty.", "hint": "Pass e.g. condition='Prone'."}
+    if target_name == "{player_name}":
+        player = next((e for e in _COMBAT_REGISTRY.values() if e.is_player), None)
+        target_name = player.name if player else target_name
+    entry = _COMBAT_REGISTRY.member(target_name)
+    if entry is None:
+        resolved, suggestions = _match_combatant(target_name)
+        entry = _COMBAT_REGISTRY.member(resolved)
+        if entry is None:
+            error = {"success": False, "error": f"'{target_name}' is not in the combat registry."}
+            if suggestions:
+                error["suggestions"] = suggestions
+            return error
+
+    if action == "add":
+        info = _registry_condition(entry.name, condition, duration, caster or None) or {}
+        if isinstance(entry, _TroopGroup):
+            _set_troop_share(entry, condition, None)  # added by hand: the whole group
+        narrative = f"{entry.name}: {condition}" + (f" ({duration})" if duration else "")
+        return {"success": True, **info, "conditions": list(entry.conditions), "narrative_format": narrative}
+    if action == "remove":
+        if condition not in entry.conditions:
+            return {"success": False, "error": "not_found", "name": entry.name, "conditions": list(entry.conditions)}
+        before, conditions_before = _COMBAT_REGISTRY.schedule_state(), list(entry.conditions)
+        entry.conditions.remove(condition)
+        _COMBAT_REGISTRY.cancel(entry.name, condition)
+        _journal_conditions(entry, conditions_before)
+        if isinstance(entry, _TroopGroup):
+            _set_troop_share(entry, condition, None)
+        _journal_schedule(before)
+        return {"success": True, "name": entry.name, "condition": condition, "conditions": list(entry.conditions),
+                "narrative_format": f"{condition} ends on {entry.name}."}
+    return {"success": False, "error": "Invalid action. Use 'add' or 'remove'."}
+
+
+# Per-target arguments of a swing. In a multiattack each named target keeps its own set, so a
+# swing that moves to another target never carries the previous target's AC or HP with it.
+VOLLEY_TARGET_FIELDS = ("target_ac", "target_current_hp", "challenge_rating", "target_save_modifier")
+VOLLEY_MAX_ATTACKS = 20  # well above any creature's attacks in one turn (Action Surge, Hydra heads)
+_VOLLEY_BEAM = False
+
+
+def _volley_entry_error(attacks, tool_name: str) -> dict | None:
+    """An error for the first attacks entry that is not a dict of arguments, or None."""
+    for i, entry in enumerate(attacks or ()):
+        if not isinstance(entry, dict):
+            return {"success": False, "error": f"attacks[{i}] must be a dict of {tool_name} arguments, got {type(entry).__name__}.",
+                    "hint": "Pass {} for an attack that repeats the call's own arguments."}
+    return None
+
+
+def _volley_profiles(call: dict, swings: list[dict]) -> dict:
+    profiles = {}
+    for fields in [call] + swings:
+        name = fields.get("target_name") or ""
+        if name in profiles or (fields is not call and not name):
+            continue
+        profile = {k: fields[k] for k in VOLLEY_TARGET_FIELDS if fields.get(k) is not None}
+        entry = _COMBAT_REGISTRY.member(name)
+        if "target_ac" not in profile and entry is not None:
+            profile["target_ac"] = entry.ac
+        profiles[name] = profile
+    return profiles
+
+
+def _volley_target_down(name: str, profile: dict) -> bool:
+    if profile.get("target_current_hp") is not None:
+        return profile["target_current_hp"] <= 0
+    entry = _COMBAT_REGISTRY.member(name)
+    return entry is not None and not entry.is_player and entry.killed
+
+
+def _resolve_volley(tool_fn, call: dict, swings: list[dict], label: str) -> dict:
+    """Resolve each swing (or beam) in order; a swing whose target is already down moves to the next target named after it."""
+    profiles = _volley_profiles(call, swings)
+    named = [fields.get("target_name") for fields in swings]
+    target = call.get("target_name") or ""
+    results = []
+    narrative_parts = []
+    damage_total = 0
+    hits = 0
+    xp_awarded = 0
+    killed = []
+
+    for i, overrides in enumerate(swings, 1):
+        target = overrides.get("target_name") or target
+        if target and _volley_target_down(target, profiles[target]):
+            standing = next((n for n in named[i:] if n and not _volley_target_down(n, profiles[n])), None)
+            if standing is None:
+                results.append({label.lower(): i, "skipped": "no target left standing"})
+                narrative_parts.append(f"{label} {i}: no target left standing.")
+                continue
+            target = standing
+
+        swing = {k: v for k, v in call.items() if k not in VOLLEY_TARGET_FIELDS}
+        swing.update((k, v) for k, v in overrides.items() if k not in VOLLEY_TARGET_FIELDS)
+        swing.update(profiles[target], target_name=target)
+        swing_result = tool_fn(**swing)
+        if swing_result.get("success") is False or "error" in swing_result:
+            _fail_unit()
+            return dict(swing_result, success=False, error=f"{label} {i}: {swing_result.get('error', 'unknown error')}",
+                        hint=f"No {label.lower()} of this turn was applied. Fix {label.lower()} {i} and resend the call.")
+
+        if "target_remaining_hp" in swing_result and profiles[target].get("target_current_hp") is not None:
+            profiles[target]["target_current_hp"] = swing_result["target_remaining_hp"]
+        if swing_result.get("outcome") in ("Success", "Critical Success"):
+            hits += 1
+        damage_total += swing_result.get("damage_total", 0)
+        xp_awarded += swing_result.get("xp_awarded", 0)
+        hit_name = swing_result.get("target_name") or target
+        if swing_result.get("target_killed"):
+            killed.append(hit_name)
+        results.append({label.lower(): i, "target_name": hit_name, "result": swing_result})
+        narrative_parts.append(f"— {label} {i}{f' → {hit_name}' if hit_name else ''} —")
+        narrative_parts.append(swing_result.get("narrative_format", ""))
+
+    resolved = [r["result"] for r in results if "result" in r]
+    summary = {
+        "success": True,
+        "actor": resolved[0]["actor"] if resolved else call.get("actor"),
+        f"{label.lower()}s": results,
+        f"{label.lower()}s_resolved": len(resolved),
+        "hits": hits,
+        "damage_total": damage_total,
+        "targets_killed": killed,
+    }
+    if xp_awarded:
+        summary["xp_awarded"] = xp_awarded
+    summary["narrative_format"] = "\n".join(narrative_parts)
+    return summary
+
+
+@_game_tool
 def resolve_attack(
     actor: str,
     attack_modifier: int,
@@ -1517,6 +3586,8 @@ def resolve_attack(
     is_npc_vs_npc: bool = False,
     advantage: bool = False,
     force_crit: bool = False,
+    count: int = 1,
+    attacks: list[dict] | None = None,
 ) -> dict:
     """
     Resolves a full weapon/unarmed attack: attack roll, damage, HP application, kill detection, XP award.
@@ -1536,6 +3607,10 @@ def resolve_attack(
     - is_npc_vs_npc: NPC attacking NPC — no player HP modified, no XP auto-awarded
     - advantage: roll 2d20 take highest
     - force_crit: any successful hit becomes a crit (for unconscious/paralyzed targets within 5 feet)
+    - count: number of identical attacks to resolve in this call (Extra Attack, NPC Multiattack), at most 20
+    - attacks: one dict per attack for attacks that differ. Each takes any of the arguments above and
+      overrides them for that attack only (e.g. {"damage_dice": "1d6", "target_name": "Goblin 2"}).
+      An attack without target_name hits the previous attack's target. count is ignored.
 
     PROJECT-SPECIFIC BEHAVIORS:
     1. Combat registry: if register_combatants was called, target_current_hp and challenge_rating
@@ -1544,12 +3619,27 @@ def resolve_attack(
     2. Extra damage dice are NOT doubled on crit. Put everything in damage_dice if you want all dice doubled.
     3. Temporary HP on the player is drained before real HP when is_npc_attack=True.
     4. XP auto-awarded on kill (unless is_npc_vs_npc=True). Uses the CR/XP table internally.
+    5. target_name is matched to the registry ignoring case, spacing and small typos ('goblin 1' ->
+       'Goblin 1'). If it is close to several registered names, an error lists "suggestions".
+    6. Multiattack (count > 1 or attacks): attacks are rolled, applied and kill-checked one at a time.
+       Once a target is down, the remaining attacks move to the next living target named later in
+       attacks; with nothing left to hit they are reported as skipped. Per-attack results are under
+       "attacks" with ONE combined narrative_format. If any attack has bad arguments, none are applied.
+       A target named only in attacks uses its registry AC when that attack gives no target_ac.
 
     EXAMPLES:
     resolve_attack(actor='{player_name}', attack_modifier=4, target_ac=13,
                    damage_dice='1d8', damage_modifier=2, target_name='Goblin',
                    target_current_hp=12, challenge_rating=0.5)
 
+    resolve_attack(actor='{player_name}', attack_modifier=7, target_ac=13,
+                   damage_dice='1d8', damage_modifier=4, target_name='Goblin 1',
+                   attacks=[{}, {}, {"target_name": "Goblin 2"}])
+
+    resolve_attack(actor='Owlbear', attack_modifier=7, target_ac=15, damage_dice='1d10',
+                   damage_modifier=5, target_name='{player_name}', is_npc_attack=True,
+                   attacks=[{}, {"damage_dice": "2d8"}])
+
     resolve_attack(actor='Goblin', attack_modifier=4, target_ac=13,
                    damage_dice='1d6', damage_modifier=2, target_name='{player_name}',
                    is_npc_attack=True)
@@ -1568,12 +3658,35 @@ def resolve_attack(
     if DB_CONNECTION is None:
         return {"success": False, "error": "Database not initialized."}
 
+    if count > 1 or attacks:
+        if (len(attacks) if attacks else count) > VOLLEY_MAX_ATTACKS:
+            requested = len(attacks) if attacks else count
+            return {"success": False, "error": f"{requested} attacks requested; one call resolves at most {VOLLEY_MAX_ATTACKS}.",
+                    "attacks_available": VOLLEY_MAX_ATTACKS,
+                    "hint": "Split the attacks over several calls, or register a mass of attackers as troops."}
+        call = {k: v for k, v in locals().items() if k not in ("count", "attacks")}
+        entry_error = _volley_entry_error(attacks, "resolve_attack")
+        if entry_error:
+            return entry_error
+        unknown = sorted({k for swing in attacks or () for k in swing} - set(call))
+        if unknown:
+            return {"success": False, "error": f"Unknown attack arguments: {', '.join(unknown)}.",
+                    "hint": "Each attacks entry takes resolve_attack arguments only."}
+        for key in ("actor", "target_name"):
+            if call[key] == "{player_name}":
+                call[key] = _player_name(DB_CONNECTION.cursor())
+        return _resolve_volley(resolve_attack, call, attacks or [{}] * count, "Attack")
+
     try:
         cursor = DB_CONNECTION.cursor()
 
         if actor == "{player_name}" and DB_CONNECTION is not None:
             actor = _db_val(cursor, "name", "Player")
 
+        target_name, name_error = _resolve_target_names(target_name, None, target_current_hp)
+        if name_error:
+            return name_error
+
         if advantage:
             d20_1 = random.randint(1, 20)
             d20_2 = random.randint(1, 20)
@@ -1640,12 +3753,13 @@ def resolve_attack(
             result["narrative_format"] = narrative_parts[0]
             return result
 
-        primary_die_size, primary_rolls, primary_sum = _parse_and_roll_dice(damage_dice)
+        primary_die_size, primary_rolls, primary_flat = _roll_dice_with_flat(damage_dice)
         if primary_die_size is None:
             return {"success": False, "error": f"Invalid damage_dice notation: '{damage_dice}'. Use format 'XdY' (e.g., '2d6')."}
+        damage_modifier += primary_flat
 
         if outcome == "Critical Success":
-            crit_rolls = [random.randint(1, primary_die_size) for _ in range(len(primary_rolls))]
+            crit_rolls = _roll_crit_dice(damage_dice)
             primary_damage = sum(primary_rolls) + sum(crit_rolls) + damage_modifier
             crit_rolls_str = " + ".join(str(r) for r in crit_rolls)
             if damage_modifier != 0:
@@ -1671,10 +3785,11 @@ def resolve_attack(
         extra_damage = 0
         extra_rolls = []
         if extra_damage_dice:
-            extra_die_size, extra_base_rolls, extra_base_sum = _parse_and_roll_dice(extra_damage_dice)
+            extra_die_size, extra_base_rolls, extra_flat = _roll_dice_with_flat(extra_damage_dice)
             if extra_die_size is None:
                 return {"success": False, "error": f"Invalid extra_damage_dice notation: '{extra_damage_dice}'. Use format 'XdY' (e.g., '1d6')."}
             extra_rolls = extra_base_rolls
+            extra_damage_modifier += extra_flat
 
             # Bug 2 fix: extra dice are NOT doubled on crit
             extra_damage = sum(extra_base_rolls) + extra_damage_modifier
@@ -1784,6 +3899,7 @@ def resolve_attack(
         return result
 
     except Exception as e:
+        _fail_unit()
         return {"success": False, "error": f"Error resolving attack: {str(e)}"}
 
 
@@ -1803,20 +3919,15 @@ def _resolve_hp_temporary(value, cursor):
     if isinstance(value, int):
         return value
     if isinstance(value, str):
-        dice_match = re.match(r'^(\d+)d(\d+)(?:\+(\d+))?$', value)
-        if dice_match:
-            num = int(dice_match.group(1))
-            size = int(dice_match.group(2))
-            flat = int(dice_match.group(3)) if dice_match.group(3) else 0
-            rolls = [random.randint(1, size) for _ in range(num)]
-            return sum(rolls) + flat
+        expr = _compile_dice(value)
+        if expr is not None and expr.terms:
+            return sum(_roll_dice_expr(expr)) + expr.flat
     return None
 
 
 def _apply_thp(cursor, spell_name, amount):
     old_thp = int(_db_val(cursor, "temporary_hit_points", 0))
     _db_set(cursor, "temporary_hit_points", str(amount))
-    DB_CONNECTION.commit()
 
     buff_data_raw = _db_val(cursor, "_active_buff_data", {})
     if isinstance(buff_data_raw, str):
@@ -1833,7 +3944,6 @@ def _apply_thp(cursor, spell_name, amount):
         effects_list.append(spell_name)
     _db_set(cursor, "active_effects", effects_list)
 
-    DB_CONNECTION.commit()
     return {"field": "temporary_hit_points", "new": amount, "old": old_thp}
 
 
@@ -1870,7 +3980,6 @@ def _apply_active_buff(cursor, spell_name, field, delta):
         effects_list.append(spell_name)
     _db_set(cursor, "active_effects", effects_list)
 
-    DB_CONNECTION.commit()
 
     return {
         "field": field,
@@ -1941,6 +4050,11 @@ def _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_re
         if active_names:
             result["active_effects"] = active_names
 
+        if buffs_applied and "error" not in buffs_applied and result.get("spell_name") in buff_data_raw:
+            ends = _schedule_player_effect(result["spell_name"], sp_duration, result.get("actor"))
+            if ends:
+                result["effect_ends"] = {"round": ends[0], "turn": ends[1]}
+
     if sp_duration and sp_duration != "Instantaneous":
         result["duration"] = sp_duration
         if sp_buffs:
@@ -1954,7 +4068,13 @@ def _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_re
                     applied_parts.append(f"{field} ({info['old']} -> {info['new']})")
             applied_str = ", ".join(applied_parts) if applied_parts else ""
             revert_str = ""
-            if active_names:
+            if result.get("effect_ends"):
+                ends = result["effect_ends"]
+                revert_str = (
+                    f"It ends automatically on next_turn at the start of {ends['turn']}'s turn "
+                    f"in round {ends['round']}. "
+                )
+            elif active_names:
                 revert_str = (
                     "Remove via: update_player_list(key='active_effects', item='"
                     + "', item='".join(active_names)
@@ -1986,7 +4106,334 @@ def _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_re
     return result
 
 
-@mcp.tool()
+def _troop_area_save(narrative_parts, group, count, save_name, spell_save_dc, save_half, damage,
+                     healing, no_damage, condition, condition_duration, actor) -> dict:
+    """Area save for a troop group: every troop caught rolls and takes its damage in one pass over the HP array."""
+    hp = group.hp
+    caught = [i for i, h in enumerate(hp) if h > 0]
+    if count:
+        caught = caught[:count]
+    rand = random.random
+    totals = array("l", [int(rand() * 20) + 1 + group.save_modifier for _ in caught])
+    saved = [total >= spell_save_dc for total in totals]
+    on_save = max(1, damage // 2) if save_half else 0
+    amounts = [on_save if ok else damage for ok in saved]
+    n_caught, n_saved = len(caught), sum(saved)
+
+    summary = {"name": group.name, "caught": n_caught, "saved": n_saved, "failed": n_caught - n_saved}
+    narrative_parts.append(
+        f"{group.name} {save_name} Saves vs DC {spell_save_dc}: {n_saved} of {n_caught} succeed, {n_caught - n_saved} fail"
+    )
+
+    fell = 0
+    if not no_damage and damage:
+        old = list(hp)
+        if healing:
+            cap = group.troop_hp
+            updated = [min(hp[i] + a, cap) for i, a in zip(caught, amounts)]
+        else:
+            updated = [max(hp[i] - a, 0) for i, a in zip(caught, amounts)]
+            fell = updated.count(0)
+        for i, value in zip(caught, updated):
+            hp[i] = value
+        _journal_registry(_registry_path(group.name, "hp"), old, list(hp))
+        label = "healing" if healing else "damage"
+        summary.update({f"{label}_on_fail": damage, f"{label}_on_save": on_save})
+        narrative_parts.append(f"{group.name}: {damage} {label} on a failed save, {on_save} on a success.")
+    elif no_damage and condition and n_caught > n_saved:
+        n_affected = n_caught - n_saved
+        whole_group = condition in group.conditions and condition not in group.affected
+        applied = _registry_condition(group.name, condition, condition_duration, actor)
+        narrative_parts.append(f"{n_affected} of {n_caught} {group.name}: Affected — {condition} ({condition_duration})")
+        if applied:
+            if not whole_group and n_affected < group.standing:
+                _set_troop_share(group, condition, max(n_affected, group.affected.get(condition, 0)))
+            else:
+                _set_troop_share(group, condition, None)
+            share = group.condition_shares().get(condition)
+            if share:
+                applied["affected"] = share
+                narrative_parts.append(f"{group.name}'s {condition} stands for {share} troops.")
+            summary["condition"] = applied
+
+    if not healing:
+        summary["fell"] = fell
+        if fell:
+            narrative_parts.append(f"{fell} of {n_caught} {group.name} fall.")
+            xp = CR_XP_TABLE.get(group.challenge_rating, 0) * fell
+            if xp:
+                summary["xp_awarded"] = xp
+    summary["standing"] = f"{group.standing}/{group.count}"
+    narrative_parts.append(f"{group.name}: {group.standing} of {group.count} still standing.")
+    return summary
+
+
+@_game_tool
+def query_spells(
+    level: int | None = None,
+    school: str | None = None,
+    damage_type: str | None = None,
+    save_type: str | None = None,
+    concentration: bool | None = None,
+    aoe: bool | None = None,
+    ritual: bool | None = None,
+    class_name: str | None = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> dict:
+    """
+    Finds spells in the spell database by their properties. Use it instead of listing spells from memory.
+
+    PARAMETERS:
+    - level: spell level (0 = cantrip)
+    - school: e.g. 'evocation', 'necromancy'
+    - damage_type: e.g. 'fire', 'radiant'
+    - save_type: saving throw ability, e.g. 'dex', 'wis'
+    - concentration: True/False to require or exclude concentration spells
+    - aoe: True/False to require or exclude area spells
+    - ritual: True/False to require or exclude ritual spells
+    - class_name: class spell list, e.g. 'Sorcerer'
+    - limit: rows per page (default 20, max 100)
+    - offset: rows to skip, for the next page
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. All filters are combined (AND). Omitted filters match everything. Text filters ignore case.
+    2. Rows are compact lists in the order given by "columns", sorted by level then name.
+    3. "total" counts every match. "next_offset" is present while more pages remain.
+    4. Class spell lists cover cantrips and 1st-level spells only: class_name with a level above 1 is an
+       error, and class_name results carry a "note" saying so.
+
+    EXAMPLES:
+    query_spells(level=3, school='evocation')
+    query_spells(class_name='Wizard', level=1, ritual=True)
+    query_spells(damage_type='fire', aoe=True, limit=10, offset=10)
+    """
+    catalog = _spell_catalog()
+    postings = catalog.indexes.get("postings", {})
+    filters = {
+        "level": level,
+        "school": school.lower().strip() if school else None,
+        "damage_type": damage_type.lower().strip() if damage_type else None,
+        "save_type": save_type.lower().strip() if save_type else None,
+        "concentration": concentration,
+        "aoe": aoe,
+        "ritual": ritual,
+        "class": class_name.lower().strip() if class_name else None,
+    }
+    if filters["class"] is not None and filters["class"] not in postings.get("class", {}):
+        return {
+            "success": False,
+            "error": f"Unknown class '{class_name}'.",
+            "known_classes": sorted(c.title() for c in postings.get("class", {})),
+        }
+    if filters["class"] is not None and level is not None and level > CLASS_SPELL_MAX_LEVEL:
+        return {
+            "success": False,
+            "error": f"Class spell lists cover cantrips and 1st-level spells only; no level {level} list exists.",
+            "hint": f"Drop class_name to search every level {level} spell, or pass level=0 or level=1.",
+        }
+    limit = max(1, min(limit, 100))
+    offset = max(0, offset)
+
+    selected = [postings.get(field, {}).get(value, set()) for field, value in filters.items() if value is not None]
+    if selected:
+        selected.sort(key=len)
+        matches = selected[0].intersection(*selected[1:])
+        keys = sorted(matches, key=lambda k: (catalog.spells[k].get("level", 0), k))
+    else:
+        keys = catalog.indexes.get("order", [])
+
+    rows = catalog.indexes.get("rows", {})
+    result = {
+        "success": True,
+        "total": len(keys),
+        "offset": offset,
+        "columns": SPELL_QUERY_COLUMNS,
+        "spells": [rows[k] for k in keys[offset:offset + limit]],
+    }
+    if offset + limit < len(keys):
+        result["next_offset"] = offset + limit
+    if filters["class"] is not None:
+        result["note"] = "Class spell lists cover cantrips and 1st-level spells only."
+    return result
+
+
+def _cast_healing_spell(cursor, result, narrative_parts, actor, spell_name, final_dice, final_mod,
+                        sp_flat_healing, sp_damage_type, targets, target_name):
+    """Player-cast automatic healing: rolls once and heals the caster, a registry target or each of `targets`.
+    Returns an error dict, or None once result and narrative_parts are filled in."""
+    heal_die_size, heal_rolls, heal_raw = _parse_and_roll_dice(final_dice)
+    if heal_die_size is None:
+        return {"success": False, "error": f"Invalid damage_dice notation: '{final_dice}'. Use format 'XdY' (e.g., '2d6')."}
+    total_healing = heal_raw + final_mod
+
+    if sp_flat_healing and total_healing == 0:
+        heal_narrative = f"{actor} {spell_name} Healing: full HP restore"
+        narrative_parts.append(heal_narrative)
+        result["healing_total"] = "full"
+
+        if targets and len(targets) > 0:
+            healed_list = []
+            for t in targets:
+                tname = t.get("name", "Unknown")
+                is_player = t.get("is_player", False)
+                tchp = t.get("current_hp")
+                if tchp is None:
+                    tchp = _registry_hp(tname) or 0
+                max_hp = _registry_max_hp(tname) or tchp
+                delta = max_hp - tchp
+                if is_player and cursor:
+                    hp_result = _apply_hp_change(cursor, delta) if delta > 0 else None
+                    healed_list.append({"name": tname, "healing": delta, "hp_change": hp_result})
+                    narrative_parts.append(f"{tname} HP: {hp_result['hp_status']}" if hp_result else f"{tname} HP: already full ({max_hp}/{max_hp})")
+                elif not is_player and tname:
+                    _registry_update_hp(tname, max_hp)
+                    healed_list.append({"name": tname, "healing": delta, "remaining_hp": max_hp, "max_hp": max_hp})
+                    narrative_parts.append(f"{tname} HP: {max_hp}/{max_hp} (fully restored)")
+            result["targets_healed"] = healed_list
+        elif target_name:
+            registry_hp = _registry_hp(target_name)
+            if registry_hp is not None:
+                max_hp = _registry_max_hp(target_name) or registry_hp
+                new_hp = max_hp
+                _registry_update_hp(target_name, new_hp)
+                result["target_healed"] = {"name": target_name, "healing": new_hp - registry_hp, "remaining_hp": new_hp, "max_hp": max_hp}
+                narrative_parts.append(f"{target_name} HP: {new_hp}/{max_hp} (fully restored)")
+            else:
+                full_hp = int(_db_val(cursor, "total_hit_points", 0))
+                hp_result = _apply_hp_change(cursor, full_hp - int(_db_val(cursor, "current_hit_points", 0))) if cursor else None
+                if hp_result:
+                    result["hp_change"] = hp_result
+        else:
+            full_hp = int(_db_val(cursor, "total_hit_points", 0))
+            current_hp = int(_db_val(cursor, "current_hit_points", 0))
+            delta = full_hp - current_hp
+            hp_result = _apply_hp_change(cursor, delta) if cursor and delta > 0 else None
+            if hp_result:
+                result["hp_change"] = hp_result
+                narrative_parts.append(f"HP: {hp_result['hp_status']}")
+
+        result["healing_rolls"] = []
+        result["damage_type"] = sp_damage_type
+        return None
+
+    if heal_rolls:
+        heal_rolls_str = " + ".join(str(r) for r in heal_rolls)
+        if final_mod != 0:
+            heal_narrative = f"{actor} {spell_name} Healing: {total_healing} ({heal_rolls_str} + {final_mod})"
+        else:
+            heal_narrative = f"{actor} {spell_name} Healing: {total_healing} ({heal_rolls_str})"
+    else:
+        heal_narrative = f"{actor} {spell_name} Healing: {total_healing}"
+    narrative_parts.append(heal_narrative)
+    result["healing_total"] = total_healing
+    result["healing_rolls"] = heal_rolls
+    result["damage_type"] = sp_damage_type
+
+    if targets and len(targets) > 0:
+        healed_list = []
+        for t in targets:
+            tname = t.get("name", "Unknown")
+            is_player = t.get("is_player", False)
+            tchp = t.get("current_hp")
+            if tchp is None:
+                tchp = _registry_hp(tname) or 0
+            max_hp = _registry_max_hp(tname) or tchp
+            new_hp = min(tchp + total_healing, max_hp)
+            if is_player and cursor:
+                delta = new_hp - tchp
+                hp_result = _apply_hp_change(cursor, delta)
+                healed_list.append({"name": tname, "healing": delta, "hp_change": hp_result})
+                narrative_parts.append(f"{tname} HP: {hp_result['hp_status']}")
+            elif not is_player and tname:
+                _registry_update_hp(tname, new_hp)
+                healed_list.append({"name": tname, "healing": new_hp - tchp, "remaining_hp": new_hp, "max_hp": max_hp})
+                narrative_parts.append(f"{tname} HP: {new_hp}/{max_hp}")
+        result["targets_healed"] = healed_list
+    elif target_name:
+        registry_hp = _registry_hp(target_name)
+        if registry_hp is not None:
+            max_hp = _registry_max_hp(target_name) or registry_hp
+            new_hp = min(registry_hp + total_healing, max_hp)
+            _registry_update_hp(target_name, new_hp)
+            result["target_healed"] = {"name": target_name, "healing": new_hp - registry_hp, "remaining_hp": new_hp, "max_hp": max_hp}
+            narrative_parts.append(f"{target_name} HP: {new_hp}/{max_hp}")
+        else:
+            hp_result = _apply_hp_change(cursor, total_healing) if cursor else None
+            if hp_result:
+                result["hp_change"] = hp_result
+    else:
+        hp_result = _apply_hp_change(cursor, total_healing) if cursor else None
+        if hp_result:
+            result["hp_change"] = hp_result
+    return None
+
+
+def _cast_hp_pool_spell(result, narrative_parts, actor, spell_name, final_dice, final_mod,
+                        sp_condition, sp_condition_duration, sp_requires_concentration, targets):
+    """HP-pool spells (Sleep, Color Spray): rolls the pool and drains it over targets by ascending HP.
+    Returns an error dict, or None once result and narrative_parts are filled in."""
+    pool_die_size, pool_rolls, pool_raw = _parse_and_roll_dice(final_dice)
+    if pool_die_size is None:
+        return {"success": False, "error": f"Invalid damage_dice notation for HP pool: '{final_dice}'."}
+    hp_pool_total = pool_raw + final_mod
+
+    pool_rolls_str = " + ".join(str(r) for r in pool_rolls)
+    pool_narrative = f"{actor} {spell_name} HP Pool: {hp_pool_total}"
+    if final_mod != 0:
+        pool_narrative += f" ({pool_rolls_str} + {final_mod})"
+    else:
+        pool_narrative += f" ({pool_rolls_str})"
+    narrative_parts.append(pool_narrative)
+
+    result["hp_pool"] = True
+    result["hp_pool_total"] = hp_pool_total
+    result["hp_pool_rolls"] = pool_rolls
+    result["damage_total"] = 0
+    result["target_killed"] = None
+    if sp_condition:
+        result["condition"] = sp_condition
+        if sp_condition_duration:
+            result["condition_duration"] = sp_condition_duration
+        if sp_requires_concentration:
+            result["requires_concentration"] = True
+
+    if targets and len(targets) > 0:
+        for t in targets:
+            if "current_hp" not in t:
+                name = t.get("name", "")
+                registry_hp = _registry_hp(name)
+                if registry_hp is not None:
+                    t["current_hp"] = registry_hp
+        sorted_targets = sorted(targets, key=lambda t: t.get("current_hp", 0))
+        affected = []
+        unaffected = []
+        remaining_pool = hp_pool_total
+        for t in sorted_targets:
+            name = t.get("name", "Unknown")
+            chp = t.get("current_hp", 0)
+            if chp <= remaining_pool:
+                affected.append({"name": name})
+                remaining_pool -= chp
+            else:
+                unaffected.append({"name": name})
+        result["targets_affected"] = affected
+        result["targets_unaffected"] = unaffected
+        result["hp_pool_remaining"] = remaining_pool
+
+        for t in affected:
+            narrative_parts.append(f"{t['name']}: Affected — {sp_condition} ({sp_condition_duration})")
+            applied = _registry_condition(t["name"], sp_condition, sp_condition_duration, actor)
+            if applied:
+                result.setdefault("conditions_applied", []).append(applied)
+        for t in unaffected:
+            narrative_parts.append(f"{t['name']}: Unaffected — HP exceeds remaining pool ({remaining_pool})")
+    elif sp_condition:
+        narrative_parts.append(f"Condition: {sp_condition} ({sp_condition_duration})")
+    return None
+
+
+@_game_tool
 def resolve_magic(
     spell_name: str,
     actor: str = "{player_name}",
@@ -2017,6 +4464,8 @@ def resolve_magic(
     advantage: bool = False,
     force_crit: bool = False,
     targets: list[dict] | None = None,
+    count: int | None = None,
+    attacks: list[dict] | None = None,
 ) -> dict:
     """
     Resolves a full spell: spell slot management, attack/save, damage/healing, HP application, kill detection, XP award.
@@ -2054,6 +4503,9 @@ def resolve_magic(
         HP pool (Sleep/Color Spray): {"name": str, "current_hp": int}
         Saving throw (Fireball/etc.): {"name": str, "current_hp": int, "save_modifier": int, "challenge_rating": float}
           Add {"is_player": True} to auto-apply damage to player HP in the DB.
+    - count: beams to fire for multi-beam spells (Eldritch Blast, Scorching Ray), all at the same target
+    - attacks: one dict per beam when beams differ, e.g. [{"target_name": "Goblin 1"}, {"target_name": "Goblin 2"}].
+      Each takes any of the arguments above for that beam only. A beam without target_name follows the previous one.
 
     PROJECT-SPECIFIC BEHAVIORS:
     1. Slot validation happens BEFORE dice are rolled. Empty slots return an error with available slots.
@@ -2067,6 +4519,14 @@ def resolve_magic(
     7. Temporary HP on the player is drained before real HP when is_npc_attack=True.
     8. Scrolls above caster's available slot level trigger an ability check (d20 + spellcasting mod vs DC 10 + spell level).
        On failure, scroll is wasted and spell does not take effect.
+    9. Near-miss spell names ('Fire ball', 'Cure wound', 'magic-missile') resolve to the database spell;
+       the result then carries "resolved_from". Ambiguous names return "suggestions" instead.
+       Target names are matched to the combat registry the same way.
+    10. Multi-beam spells: pass count or attacks to roll every beam in one call — one slot, one attack
+        roll and damage roll per beam, applied and kill-checked in order. Eldritch Blast has 1 beam, 2 at
+        character level 5, 3 at 11 and 4 at 17; Scorching Ray has 3 plus 1 per slot level above 2nd.
+        Asking for more beams than the cast has is an error. When a target drops, the remaining beams
+        move to the next living target named later in attacks. Results are under "beams".
 
     EXAMPLES:
     resolve_magic(spell_name='Fireball', actor='{player_name}',
@@ -2139,9 +4599,15 @@ def resolve_magic(
                   spell_attack_modifier=4, target_ac=10,
                   target_name='Sleeping Guard', target_current_hp=6,
                   challenge_rating=0, advantage=True, force_crit=True)
+
+    resolve_magic(spell_name='Scorching Ray', actor='{player_name}',
+                  spell_attack_modifier=6, target_ac=15, target_name='Orc 1',
+                  attacks=[{}, {}, {"target_name": "Orc 2", "target_ac": 13}])
     """
-    global DB_CONNECTION
-    spells_db = _load_spells()
+    global DB_CONNECTION, _VOLLEY_BEAM
+    volley_args = {k: v for k, v in locals().items() if k not in ("count", "attacks")}
+    catalog = _spell_catalog()
+    spells_db = catalog.spells
 
     if actor == "{player_name}" and DB_CONNECTION is not None:
         cursor = DB_CONNECTION.cursor()
@@ -2151,6 +4617,15 @@ def resolve_magic(
 
     spell_key = spell_name.lower().strip()
     spell = spells_db.get(spell_key)
+    resolved_from = None
+    suggestions = []
+    if spell is None and (attack_type is None or damage_dice is None):
+        matched_key, suggestions = _match_name(catalog.indexes.get("names"), spell_name)
+        if matched_key is not None:
+            resolved_from = spell_name
+            spell_key = matched_key
+            spell = spells_db[spell_key]
+            spell_name = spell["name"]
 
     if spell:
         sp_attack_type = spell.get("attack_type", "attack_roll")
@@ -2179,7 +4654,7 @@ def resolve_magic(
         sp_buffs = spell.get("buffs", None)
     else:
         if attack_type is None or damage_dice is None:
-            return {
+            error = {
                 "success": False,
                 "error": f"Spell '{spell_name}' not found in spells database.",
                 "hint": "Provide attack_type and damage_dice to cast a custom spell, or use one of the known spells.",
@@ -2189,6 +4664,9 @@ def resolve_magic(
                     "cantrip_scaling", "higher_levels", "healing", "aoe",
                 ],
             }
+            if suggestions:
+                error["suggestions"] = [spells_db[k]["name"] for k in suggestions]
+            return error
         sp_attack_type = attack_type.lower().strip()
         sp_damage_dice = damage_dice
         sp_damage_modifier = damage_modifier
@@ -2196,6 +4674,7 @@ def resolve_magic(
         sp_save_type = save_type
         sp_save_half = save_half
         sp_healing = healing
+        sp_flat_healing = False
         sp_aoe = aoe
         sp_cantrip_scaling = cantrip_scaling
         sp_higher_levels = higher_levels
@@ -2213,6 +4692,28 @@ def resolve_magic(
         sp_duration = "Instantaneous"
         sp_buffs = None
 
+    plan = catalog.plans.get(spell_key) if spell else None
+    category = plan.category if plan else _spell_category(sp_attack_type, sp_healing, sp_hp_pool, sp_no_damage, sp_buffs)
+
+    target_name, name_error = _resolve_target_names(target_name, targets, target_current_hp)
+    if name_error:
+        return name_error
+
+    volley = count is not None or bool(attacks)
+    if volley:
+        if not (spell and spell.get("multi_hit")):
+            return {"success": False, "error": f"{spell_name} does not fire separate beams; count and attacks only apply to multi-beam spells.",
+                    "hint": "Use resolve_round to resolve several different casts in one call."}
+        if not attacks and count < 1:
+            return {"success": False, "error": "count must be at least 1."}
+        entry_error = _volley_entry_error(attacks, "resolve_magic")
+        if entry_error:
+            return entry_error
+        unknown = sorted({k for beam in attacks or () for k in beam} - set(volley_args))
+        if unknown:
+            return {"success": False, "error": f"Unknown beam arguments: {', '.join(unknown)}.",
+                    "hint": "Each attacks entry takes resolve_magic arguments only."}
+
     # ── DUPLICATE ACTIVE EFFECT CHECK ──
     if sp_buffs and DB_CONNECTION is not None:
         buff_data_raw = _db_val(cursor, "_active_buff_data", {})
@@ -2237,7 +4738,7 @@ def resolve_magic(
     slot_narrative = None
     scroll_check_info = None
 
-    if not is_npc_attack and not is_npc_vs_npc and not is_cantrip and not ritual and not is_scroll and DB_CONNECTION is not None:
+    if not is_npc_attack and not is_npc_vs_npc and not is_cantrip and not ritual and not is_scroll and not _VOLLEY_BEAM and DB_CONNECTION is not None:
         if slot_level is not None:
             effective_slot = slot_level
         elif spell:
@@ -2264,11 +4765,9 @@ def resolve_magic(
         validation = _validate_spell_slot(cursor, slot_key, -1)
 
         if validation:
-            cursor.execute("SELECT value FROM player WHERE key = ?", ("spellcasting",))
-            sc_row = cursor.fetchone()
+            sc_data = _db_val(cursor, "spellcasting")
             available_slots = {}
-            if sc_row:
-                sc_data = json.loads(sc_row[0])
+            if isinstance(sc_data, dict):
                 for k, v in sc_data.get("slots", {}).items():
                     if int(v) > 0:
                         available_slots[f"lv{k}"] = v
@@ -2281,13 +4780,10 @@ def resolve_magic(
                 "hint": "Take a long rest to recover spell slots, or cast using a higher-level slot by providing slot_level.",
             }
 
-        cursor.execute("SELECT value FROM player WHERE key = ?", ("spellcasting",))
-        sc_check = cursor.fetchone()
-        if sc_check:
-            sc_data_check = json.loads(sc_check[0])
+        sc_data_check = _db_val(cursor, "spellcasting")
+        if isinstance(sc_data_check, dict):
             str_effective_slot = str(effective_slot)
             if str_effective_slot not in sc_data_check.get("slots", {}):
-                cursor.execute("SELECT key FROM player")
                 return {
                     "success": False,
                     "error": f"Player has no level {effective_slot} spell slots. Maximum available slot level may be insufficient for this spell.",
@@ -2305,7 +4801,9 @@ def resolve_magic(
 
     # ── CONSUME SPELL SLOT ──
     slot_result_data = None
-    if not is_npc_attack and not is_npc_vs_npc and not is_cantrip and not ritual and not is_scroll and DB_CONNECTION is not None:
+    if _VOLLEY_BEAM:
+        slot_consumed = "beam"
+    elif not is_npc_attack and not is_npc_vs_npc and not is_cantrip and not ritual and not is_scroll and DB_CONNECTION is not None:
         slot_result_data = modify_player_numeric(key=slot_key, delta=-1)
         slot_level_used = effective_slot
         slot_consumed = True
@@ -2326,11 +4824,8 @@ def resolve_magic(
         slot_narrative = "Scroll Cast — no slot consumed"
         effective_slot = slot_level if slot_level is not None else sp_level
         if not is_cantrip and effective_slot > 0 and cursor:
-            sc_row = cursor.execute(
-                "SELECT value FROM player WHERE key = ?", ("spellcasting",)
-            ).fetchone()
-            if sc_row:
-                sc_data = json.loads(sc_row[0])
+            sc_data = _db_val(cursor, "spellcasting")
+            if isinstance(sc_data, dict):
                 if str(effective_slot) not in sc_data.get("slots", {}):
                     ability_name = sc_data.get("ability", "intelligence").lower()
                     stat_key = {"intelligence": "int", "wisdom": "wis", "charisma": "cha"}.get(ability_name, "int")
@@ -2370,8 +4865,12 @@ def resolve_magic(
         character_level = 1
 
     computed_slot = slot_level if slot_level is not None else (sp_level if not sp_cantrip_scaling else 0)
-    final_dice, final_mod, final_extra_dice = _compute_spell_damage(
-        spell if spell else {
+    if plan:
+        final_dice, final_mod, final_extra_dice = _planned_spell_damage(
+            plan, spell, character_level, computed_slot if not sp_cantrip_scaling else None,
+        )
+    else:
+        final_dice, final_mod, final_extra_dice = _spell_damage_entry({
             "damage_dice": sp_damage_dice,
             "damage_modifier": sp_damage_modifier,
             "level": sp_level,
@@ -2381,12 +4880,36 @@ def resolve_magic(
             "extra_damage_dice": sp_extra_damage_dice,
             "extra_damage_type": sp_extra_damage_type,
             "extra_higher_levels": None,
-        },
-        character_level,
-        computed_slot if not sp_cantrip_scaling else None,
-    )
-
-
+        }, character_level, computed_slot if not sp_cantrip_scaling else None)
+
+    if _VOLLEY_BEAM:
+        final_dice, final_mod = sp_damage_dice, sp_damage_modifier
+    elif volley:
+        beams = _spell_beams(spell, caster_level if caster_level is not None else character_level,
+                             slot_level_used or slot_level)
+        if len(attacks or ()) > beams or (count or 0) > beams:
+            _fail_unit()
+            return {"success": False, "error": f"{spell_name} fires {beams} beam{'s' if beams != 1 else ''} at this level.",
+                    "beams_available": beams, "hint": "No slot was used. Resend with at most that many beams."}
+        call = dict(volley_args, spell_name=spell_name, actor=actor, target_name=target_name, slot_level=slot_level_used or slot_level)
+        _VOLLEY_BEAM = True
+        try:
+            result = _resolve_volley(resolve_magic, call, attacks or [{}] * count, "Beam")
+        finally:
+            _VOLLEY_BEAM = False
+        if result.get("success") is False:
+            return result
+        result.update(spell_name=spell_name, slot_consumed=slot_consumed, beams_available=beams)
+        if resolved_from:
+            result["resolved_from"] = resolved_from
+        if slot_level_used is not None:
+            result["slot_level_used"] = slot_level_used
+            result["slot_result"] = slot_result_data
+        if scroll_check_info:
+            result["scroll_check"] = scroll_check_info
+        if slot_narrative:
+            result["narrative_format"] = slot_narrative + "\n" + result["narrative_format"]
+        return result
 
     narrative_parts = []
     if slot_narrative:
@@ -2399,6 +4922,8 @@ def resolve_magic(
         "attack_type": sp_attack_type,
         "slot_consumed": slot_consumed,
     }
+    if resolved_from:
+        result["resolved_from"] = resolved_from
     if slot_level_used is not None:
         result["slot_level_used"] = slot_level_used
     if scroll_check_info:
@@ -2409,7 +4934,7 @@ def resolve_magic(
     is_crit = False
 
     # ── ATTACK ROLL ──
-    if sp_attack_type == "attack_roll":
+    if category == "attack":
         if advantage:
             d20_1 = random.randint(1, 20)
             d20_2 = random.randint(1, 20)
@@ -2485,171 +5010,16 @@ def resolve_magic(
         result["target_killed"] = None
         return _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, is_npc_attack or is_npc_vs_npc, is_npc_vs_npc)
 
-    if sp_healing and not is_npc_attack and not is_npc_vs_npc and sp_attack_type == "automatic":
-        heal_die_size, heal_rolls, heal_raw = _parse_and_roll_dice(final_dice)
-        if heal_die_size is None:
-            return {"success": False, "error": f"Invalid damage_dice notation: '{final_dice}'. Use format 'XdY' (e.g., '2d6')."}
-        total_healing = heal_raw + final_mod
-
-        if sp_flat_healing and total_healing == 0:
-            heal_narrative = f"{actor} {spell_name} Healing: full HP restore"
-            narrative_parts.append(heal_narrative)
-            result["healing_total"] = "full"
-
-            if targets and len(targets) > 0:
-                healed_list = []
-                for t in targets:
-                    tname = t.get("name", "Unknown")
-                    is_player = t.get("is_player", False)
-                    tchp = t.get("current_hp")
-                    if tchp is None:
-                        tchp = _registry_hp(tname) or 0
-                    max_hp = _registry_max_hp(tname) or tchp
-                    delta = max_hp - tchp
-                    if is_player and cursor:
-                        hp_result = _apply_hp_change(cursor, delta) if delta > 0 else None
-                        healed_list.append({"name": tname, "healing": delta, "hp_change": hp_result})
-                        narrative_parts.append(f"{tname} HP: {hp_result['hp_status']}" if hp_result else f"{tname} HP: already full ({max_hp}/{max_hp})")
-                    elif not is_player and tname:
-                        _registry_update_hp(tname, max_hp)
-                        healed_list.append({"name": tname, "healing": delta, "remaining_hp": max_hp, "max_hp": max_hp})
-                        narrative_parts.append(f"{tname} HP: {max_hp}/{max_hp} (fully restored)")
-                result["targets_healed"] = healed_list
-            elif target_name:
-                registry_hp = _registry_hp(target_name)
-                if registry_hp is not None:
-                    max_hp = _registry_max_hp(target_name) or registry_hp
-                    new_hp = max_hp
-                    _registry_update_hp(target_name, new_hp)
-                    result["target_healed"] = {"name": target_name, "healing": new_hp - registry_hp, "remaining_hp": new_hp, "max_hp": max_hp}
-                    narrative_parts.append(f"{target_name} HP: {new_hp}/{max_hp} (fully restored)")
-                else:
-                    full_hp = int(_db_val(cursor, "total_hit_points", 0))
-                    hp_result = _apply_hp_change(cursor, full_hp - int(_db_val(cursor, "current_hit_points", 0))) if cursor else None
-                    if hp_result:
-                        result["hp_change"] = hp_result
-            else:
-                full_hp = int(_db_val(cursor, "total_hit_points", 0))
-                current_hp = int(_db_val(cursor, "current_hit_points", 0))
-                delta = full_hp - current_hp
-                hp_result = _apply_hp_change(cursor, delta) if cursor and delta > 0 else None
-                if hp_result:
-                    result["hp_change"] = hp_result
-                    narrative_parts.append(f"HP: {hp_result['hp_status']}")
-
-            result["healing_rolls"] = []
-            result["damage_type"] = sp_damage_type
-            return _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, is_npc_attack or is_npc_vs_npc, is_npc_vs_npc)
-
-        if heal_rolls:
-            heal_rolls_str = " + ".join(str(r) for r in heal_rolls)
-            if final_mod != 0:
-                heal_narrative = f"{actor} {spell_name} Healing: {total_healing} ({heal_rolls_str} + {final_mod})"
-            else:
-                heal_narrative = f"{actor} {spell_name} Healing: {total_healing} ({heal_rolls_str})"
-        else:
-            heal_narrative = f"{actor} {spell_name} Healing: {total_healing}"
-        narrative_parts.append(heal_narrative)
-        result["healing_total"] = total_healing
-        result["healing_rolls"] = heal_rolls
-        result["damage_type"] = sp_damage_type
-
-        if targets and len(targets) > 0:
-            healed_list = []
-            for t in targets:
-                tname = t.get("name", "Unknown")
-                is_player = t.get("is_player", False)
-                tchp = t.get("current_hp")
-                if tchp is None:
-                    tchp = _registry_hp(tname) or 0
-                max_hp = _registry_max_hp(tname) or tchp
-                new_hp = min(tchp + total_healing, max_hp)
-                if is_player and cursor:
-                    delta = new_hp - tchp
-                    hp_result = _apply_hp_change(cursor, delta)
-                    healed_list.append({"name": tname, "healing": delta, "hp_change": hp_result})
-                    narrative_parts.append(f"{tname} HP: {hp_result['hp_status']}")
-                elif not is_player and tname:
-                    _registry_update_hp(tname, new_hp)
-                    healed_list.append({"name": tname, "healing": new_hp - tchp, "remaining_hp": new_hp, "max_hp": max_hp})
-                    narrative_parts.append(f"{tname} HP: {new_hp}/{max_hp}")
-            result["targets_healed"] = healed_list
-        elif target_name:
-            registry_hp = _registry_hp(target_name)
-            if registry_hp is not None:
-                max_hp = _registry_max_hp(target_name) or registry_hp
-                new_hp = min(registry_hp + total_healing, max_hp)
-                _registry_update_hp(target_name, new_hp)
-                result["target_healed"] = {"name": target_name, "healing": new_hp - registry_hp, "remaining_hp": new_hp, "max_hp": max_hp}
-                narrative_parts.append(f"{target_name} HP: {new_hp}/{max_hp}")
-            else:
-                hp_result = _apply_hp_change(cursor, total_healing) if cursor else None
-                if hp_result:
-                    result["hp_change"] = hp_result
-        else:
-            hp_result = _apply_hp_change(cursor, total_healing) if cursor else None
-            if hp_result:
-                result["hp_change"] = hp_result
-        return _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, is_npc_attack or is_npc_vs_npc, is_npc_vs_npc)
+    if category == "heal" and not is_npc_attack and not is_npc_vs_npc:
+        error = _cast_healing_spell(cursor, result, narrative_parts, actor, spell_name, final_dice, final_mod,
+                                    sp_flat_healing, sp_damage_type, targets, target_name)
+        return error or _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, False)
 
     # ── HP POOL (Sleep, Color Spray) ──
-    if sp_hp_pool and not sp_healing:
-        pool_die_size, pool_rolls, pool_raw = _parse_and_roll_dice(final_dice)
-        if pool_die_size is None:
-            return {"success": False, "error": f"Invalid damage_dice notation for HP pool: '{final_dice}'."}
-        hp_pool_total = pool_raw + final_mod
-
-        pool_rolls_str = " + ".join(str(r) for r in pool_rolls)
-        pool_narrative = f"{actor} {spell_name} HP Pool: {hp_pool_total}"
-        if final_mod != 0:
-            pool_narrative += f" ({pool_rolls_str} + {final_mod})"
-        else:
-            pool_narrative += f" ({pool_rolls_str})"
-        narrative_parts.append(pool_narrative)
-
-        result["hp_pool"] = True
-        result["hp_pool_total"] = hp_pool_total
-        result["hp_pool_rolls"] = pool_rolls
-        result["damage_total"] = 0
-        result["target_killed"] = None
-        if sp_condition:
-            result["condition"] = sp_condition
-            if sp_condition_duration:
-                result["condition_duration"] = sp_condition_duration
-            if sp_requires_concentration:
-                result["requires_concentration"] = True
-
-        if targets and len(targets) > 0:
-            for t in targets:
-                if "current_hp" not in t:
-                    name = t.get("name", "")
-                    registry_hp = _registry_hp(name)
-                    if registry_hp is not None:
-                        t["current_hp"] = registry_hp
-            sorted_targets = sorted(targets, key=lambda t: t.get("current_hp", 0))
-            affected = []
-            unaffected = []
-            remaining_pool = hp_pool_total
-            for t in sorted_targets:
-                name = t.get("name", "Unknown")
-                chp = t.get("current_hp", 0)
-                if chp <= remaining_pool:
-                    affected.append({"name": name})
-                    remaining_pool -= chp
-                else:
-                    unaffected.append({"name": name})
-            result["targets_affected"] = affected
-            result["targets_unaffected"] = unaffected
-            result["hp_pool_remaining"] = remaining_pool
-
-            for t in affected:
-                narrative_parts.append(f"{t['name']}: Affected — {sp_condition} ({sp_condition_duration})")
-            for t in unaffected:
-                narrative_parts.append(f"{t['name']}: Unaffected — HP exceeds remaining pool ({remaining_pool})")
-        elif sp_condition:
-            narrative_parts.append(f"Condition: {sp_condition} ({sp_condition_duration})")
-
-        return _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, is_npc_attack or is_npc_vs_npc, is_npc_vs_npc)
+    if category == "hp_pool":
+        error = _cast_hp_pool_spell(result, narrative_parts, actor, spell_name, final_dice, final_mod,
+                                    sp_condition, sp_condition_duration, sp_requires_concentration, targets)
+        return error or _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, is_npc_attack or is_npc_vs_npc, is_npc_vs_npc)
 
     # ── ROLL DAMAGE ──
     if not sp_no_damage:
@@ -2660,7 +5030,7 @@ def resolve_magic(
         label = "Healing" if sp_healing else "Damage"
 
         if is_crit:
-            crit_rolls = [random.randint(1, primary_die_size) for _ in range(len(primary_rolls))]
+            crit_rolls = _roll_crit_dice(final_dice)
             primary_damage = primary_sum + sum(crit_rolls) + final_mod
             crit_rolls_str = " + ".join(str(r) for r in crit_rolls)
             if primary_rolls:
@@ -2702,8 +5072,10 @@ def resolve_magic(
             if extra_die_size is None:
                 return {"success": False, "error": f"Invalid extra_damage_dice notation: '{final_extra_dice}'."}
             extra_rolls = extra_base_rolls
-            extra_damage = sum(extra_base_rolls)
+            extra_damage = extra_base_sum
             extra_base_str = " + ".join(str(r) for r in extra_base_rolls)
+            if extra_base_sum != sum(extra_base_rolls):
+                extra_base_str += f" + {extra_base_sum - sum(extra_base_rolls)}"
             ext_type_label = sp_extra_damage_type.title() if sp_extra_damage_type else "Extra"
             narrative_parts.append(
                 f"{actor} {spell_name} {ext_type_label} Damage: {extra_damage} ({extra_base_str})"
@@ -2720,13 +5092,24 @@ def resolve_magic(
 
     # ── MULTI-TARGET SAVING THROW ──
     target_results = None
-    if targets and len(targets) > 0 and sp_attack_type == "saving_throw":
+    if targets and len(targets) > 0 and category == "save":
         total_xp = 0
         target_results = []
         killed_count = 0
         save_name = sp_save_type.upper() if sp_save_type else "SAVE"
 
         for t in targets:
+            group = None if t.get("is_player") else _COMBAT_REGISTRY.troop(t.get("name"))
+            if group is not None:
+                troop_result = _troop_area_save(
+                    narrative_parts, group, t.get("count"), save_name, spell_save_dc, sp_save_half, total_damage,
+                    sp_healing, sp_no_damage, sp_condition, sp_condition_duration or sp_duration, actor,
+                )
+                result.setdefault("troops", []).append(troop_result)
+                killed_count += troop_result.get("fell", 0)
+                total_xp += troop_result.get("xp_awarded", 0)
+                continue
+
             tname = t.get("name", "Unknown")
             tchp = t.get("current_hp")
             if tchp is None:
@@ -2772,6 +5155,9 @@ def resolve_magic(
                 )
                 if sp_no_damage and sp_condition:
                     narrative_parts.append(f"{tname}: Affected — {sp_condition} ({sp_condition_duration})")
+                    applied = _registry_condition(tname, sp_condition, sp_condition_duration or sp_duration, actor)
+                    if applied:
+                        result.setdefault("conditions_applied", []).append(applied)
 
             remaining = min(tchp + t_damage, _registry_max_hp(tname) or tchp) if sp_healing else tchp - t_damage
             killed = False if sp_healing else (remaining <= 0 if tchp > 0 else False)
@@ -2825,7 +5211,7 @@ def resolve_magic(
         return _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, is_npc_attack or is_npc_vs_npc, is_npc_vs_npc)
 
     # ── SINGLE-TARGET SAVING THROW ──
-    if sp_attack_type == "saving_throw":
+    if category == "save":
         save_mod = player_save_modifier if is_npc_attack and player_save_modifier is not None else target_save_modifier
         saver_name = target_name or actor
         save_d20 = random.randint(1, 20)
@@ -2863,6 +5249,9 @@ def resolve_magic(
                     narrative_parts.append(f"{saver_name} saved — no damage.")
         elif sp_no_damage and sp_condition:
             narrative_parts.append(f"{saver_name}: Affected — {sp_condition} ({sp_condition_duration})")
+            applied = _registry_condition(target_name, sp_condition, sp_condition_duration or sp_duration, actor)
+            if applied:
+                result.setdefault("conditions_applied", []).append(applied)
 
     result["damage_total"] = total_damage
     result["damage_type"] = sp_damage_type
@@ -2992,10 +5381,149 @@ def resolve_magic(
     return _finalize_spell_result(result, narrative_parts, sp_duration, sp_buffs, sp_requires_concentration, is_npc_attack or is_npc_vs_npc, is_npc_vs_npc)
 
 
+ROUND_ACTION_TOOLS = {
+    "attack": resolve_attack,
+    "spell": resolve_magic,
+    "check": perform_check,
+}
+
+
+# Registered without _game_tool: every action runs as its own unit of work, so
+# an action that fails part-way is rolled back without undoing the others.
+def resolve_round(actions: list[dict]) -> dict:
+    """
+    Resolves a whole combat round — every attack, spell, and check — in a single call.
+
+    PARAMETERS:
+    - actions: ordered list of action dicts. Each needs a "type" plus the SAME arguments the
+      matching single tool takes:
+      - {"type": "attack", ...resolve_attack arguments}
+      - {"type": "spell", ...resolve_magic arguments}
+      - {"type": "check", ...perform_check arguments}
+
+    PROJECT-SPECIFIC BEHAVIORS:
+    1. Actions are applied strictly in order against the combat registry and the player database.
+       A kill or HP change in action 2 is already visible to action 3.
+    2. A failing action (bad arguments, empty spell slot, unknown type, an error inside the tool) does NOT
+       abort the round. Its error is reported in its own result and the remaining actions still resolve.
+       Each action is committed on its own; an action that errors part-way leaves no changes behind.
+    3. Returns per-action results ('acts' in compact responses) plus ONE combined narrative
+       ('n'; 'narrative_format' in verbose responses) — disclose it verbatim.
+    4. Use this for initiative-order rounds: list every combatant's action in turn order.
+
+    EXAMPLES:
+    resolve_round(actions=[
+        {"type": "spell", "spell_name": "Fire Bolt", "actor": "{player_name}",
+         "spell_attack_modifier": 6, "target_ac": 15, "target_name": "Goblin 1"},
+        {"type": "attack", "actor": "Goblin 2", "attack_modifier": 4, "target_ac": 13,
+         "damage_dice": "1d6", "damage_modifier": 2, "is_npc_attack": True},
+        {"type": "attack", "actor": "Kella", "attack_modifier": 5, "target_ac": 15,
+         "damage_dice": "1d8", "damage_modifier": 3, "target_name": "Goblin 2", "is_npc_vs_npc": True},
+        {"type": "check", "actor": "Goblin 2", "modifier": 2, "dc": 13, "check_name": "Wisdom Save"},
+    ])
+    """
+    if not actions:
+        return {"success": False, "error": "No actions provided.",
+                "hint": "Pass an ordered list of {'type': 'attack'|'spell'|'check', ...} dicts."}
+
+    results = []
+    narrative_parts = []
+    failed = 0
+
+    for i, action in enumerate(actions, 1):
+        if not isinstance(action, dict):
+            action, bad_type = {}, type(action).__name__
+        else:
+            action, bad_type = dict(action), None
+        action_type = str(action.pop("type", "")).lower().strip()
+        tool_fn = ROUND_ACTION_TOOLS.get(action_type)
+
+        if bad_type:
+            action_result = {"success": False, "error": f"Action {i} must be a dict, got {bad_type}."}
+        elif tool_fn is None:
+            action_result = {
+                "success": False,
+                "error": f"Unknown action type '{action_type}'.",
+                "hint": f"Use one of: {', '.join(ROUND_ACTION_TOOLS)}.",
+            }
+        else:
+            try:
+                action_result = tool_fn(**action)
+            except TypeError as e:
+                action_result = {"success": False, "error": f"Invalid arguments for {action_type} action: {str(e)}"}
+            except Exception as e:
+                # The failed unit is already rolled back; the actions before it stand and are reported.
+                action_result = {"success": False, "error": f"Error resolving {action_type} action: {str(e)}"}
+
+        if action_result.get("success") is False or "error" in action_result:
+            failed += 1
+            narrative_parts.append(f"Action {i} ({action_type or '?'}) failed: {action_result.get('error', 'unknown error')}")
+        elif action_result.get("narrative_format"):
+            narrative_parts.append(action_result["narrative_format"])
+
+        results.append({"action": i, "type": action_type, "result": action_result})
+
+    return {
+        "success": True,
+        "actions_resolved": len(actions) - failed,
+        "actions_failed": failed,
+        "results": results,
+        "narrative_format": "\n".join(narrative_parts),
+    }
+
+
+_serve(resolve_round, resolve_round)
+
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        player_file = sys.argv[1]
-        init_status = init_player_db(player_file)
+    parser = argparse.ArgumentParser(description="Infinity dice and rules MCP server")
+    parser.add_argument("player_file", nargs="?", help="Path to the .player file to load (stdio transport)")
+    parser.add_argument("--session-db", action="store_true",
+                        help="Keep state in a WAL-mode <name>.session.db next to the .player file and resume it on restart")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default="stdio",
+                        help="stdio serves one game; sse/streamable-http serve many, one per client session")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address for network transports")
+    parser.add_argument("--port", type=int, default=8000, help="Port for network transports")
+    parser.add_argument("--player-root", default=PLAYER_ROOT,
+                        help="Directory that open_session may load .player files from")
+    parser.add_argument("--warm", action="store_true",
+                        help="Load the spell database before serving, so the first tool call pays no startup cost")
+    parser.add_argument("--catalog-poll", type=float, default=CATALOG_POLL_INTERVAL, metavar="SECONDS",
+                        help="How often to check config/spells.yml for edits and hot-reload it (0 disables)")
+    parser.add_argument("--response-profile", choices=RESPONSE_PROFILES, default=RESPONSE_PROFILE,
+                        help="compact: narrative plus short-keyed deltas; verbose: full result dicts (debugging)")
+    parser.add_argument("--build-spell-index", action="store_true",
+                        help="Compile config/spells.yml into its binary index and exit")
+    parser.add_argument("--build-monster-index", action="store_true",
+                        help="Compile config/monsters.yml into its binary index and exit")
+    args = parser.parse_args()
+
+    if args.build_spell_index or args.build_monster_index:
+        if args.build_spell_index:
+            spell_count = len(build_spell_index()["spells"])
+            print(f"Spell index written to {SPELL_INDEX_PATH} ({spell_count} spells).", file=sys.stderr)
+        if args.build_monster_index:
+            monster_count = len(build_monster_index()["monsters"])
+            print(f"Monster index written to {MONSTER_INDEX_PATH} ({monster_count} monsters).", file=sys.stderr)
+        sys.exit(0)
+
+    RESPONSE_PROFILE = args.response_profile
+
+    if args.player_file:
+        init_status = init_player_db(args.player_file, session_db=args.session_db)
         print(f"Server DB Init: {init_status}", file=sys.stderr)
 
-    mcp.run(transport="stdio")
+    if args.warm:
+        _load_spells()
+    else:
+        _start_spell_warmup()
+    if args.catalog_poll > 0:
+        _start_catalog_watcher(args.catalog_poll)
+
+    if args.transport != "stdio":
+        _SESSION_SCOPED = True
+        PLAYER_ROOT = args.player_root
+        mcp.settings.host = args.host
+        mcp.settings.port = args.port
+
+    mcp.run(transport=args.transport)
@@ -0,0 +1,292 @@
+"""
+Warm pool of dice_server.py workers.
+
+Starting a game normally spawns a fresh dice_server.py, paying interpreter
+startup, the mcp/yaml/level_up imports and the spell database load before the
+first tool call. The pool keeps `size` workers already running those steps to
+completion, each serving streamable HTTP on its own local port. A game leases
+one, calls open_session to seed it with its .player file, and releases it
+when it ends; released workers are retired and replaced so every game starts
+on a clean process.
+
+A worker that fails to start is logged and its replacement retried with
+backoff. A lease waits at most ACQUIRE_TIMEOUT for a free worker. Leases expire
+after `lease_ttl` seconds unless renewed, so a client that dies without
+releasing does not hold its worker forever. Worker stderr is appended to
+`worker_log`.
+
+Run it as a supervisor on a shared host and point run_game(pool_url=...) at it:
+
+    python engine_pool.py --size 4 --port 8099
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import socket
+import sys
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dice_server.py")
+WORKER_START_TIMEOUT = 30.0
+ACQUIRE_TIMEOUT = 30.0
+LEASE_TTL = 900.0
+SPAWN_RETRY_BASE = 1.0
+SPAWN_RETRY_MAX = 60.0
+
+
+class PoolExhausted(Exception):
+    """No worker became free within the acquire timeout."""
+
+
+def _free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class EngineWorker:
+    def __init__(self, worker_id: int, host: str, port: int, process):
+        self.id = worker_id
+        self.host = host
+        self.port = port
+        self.process = process
+        self.lease_expires = 0.0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/mcp"
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+
+class EnginePool:
+    def __init__(self, size: int = 2, host: str = "127.0.0.1", player_root: str = "output",
+                 lease_ttl: float = LEASE_TTL, acquire_timeout: float = ACQUIRE_TIMEOUT, worker_log: str | None = None):
+        self.size = size
+        self.host = host
+        self.player_root = player_root
+        self.lease_ttl = lease_ttl
+        self.acquire_timeout = acquire_timeout
+        self.worker_log = worker_log or os.path.join(player_root, "engine_pool_workers.log")
+        self._ids = itertools.count(1)
+        self._idle: asyncio.Queue[EngineWorker] = asyncio.Queue()
+        self._leased: dict[int, EngineWorker] = {}
+        self._starting: set[asyncio.Task] = set()
+        self._retries: set[asyncio.TimerHandle] = set()
+        self._reaper: asyncio.Task | None = None
+        self._closed = False
+
+    async def start(self):
+        """Spawn the initial workers; the ones that fail to start are retried in the background."""
+        results = await asyncio.gather(*(self._spawn() for _ in range(self.size)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                self._spawn_failed(result, 0)
+        if self._idle.empty():
+            raise RuntimeError(f"No engine worker started; see {self.worker_log}.")
+        self._reaper = asyncio.create_task(self._reap())
+
+    async def acquire(self) -> EngineWorker:
+        """Lease a warm worker and start warming its replacement; PoolExhausted if none frees up in time."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.acquire_timeout
+        while True:
+            try:
+                worker = await asyncio.wait_for(self._idle.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise PoolExhausted(f"No engine worker free within {self.acquire_timeout:.0f}s.") from None
+            self._refill()
+            if worker.alive:
+                worker.lease_expires = loop.time() + self.lease_ttl
+                self._leased[worker.id] = worker
+                return worker
+
+    def renew(self, worker_id: int) -> bool:
+        """Push a lease's expiry lease_ttl seconds into the future."""
+        worker = self._leased.get(worker_id)
+        if worker is None:
+            return False
+        worker.lease_expires = asyncio.get_running_loop().time() + self.lease_ttl
+        return True
+
+    async def release(self, worker_id: int) -> bool:
+        worker = self._leased.pop(worker_id, None)
+        if worker is None:
+            return False
+        await self._stop(worker)
+        return True
+
+    def status(self) -> dict:
+        return {"idle": self._idle.qsize(), "leased": sorted(self._leased), "starting": len(self._starting),
+                "retrying": len(self._retries)}
+
+    async def close(self):
+        self._closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+        for handle in list(self._retries):
+            handle.cancel()
+        self._retries.clear()
+        for task in list(self._starting):
+            task.cancel()
+        workers = list(self._leased.values())
+        while not self._idle.empty():
+            workers.append(self._idle.get_nowait())
+        self._leased.clear()
+        await asyncio.gather(*(self._stop(w) for w in workers))
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _refill(self, attempt: int = 0):
+        if self._closed:
+            return
+        task = asyncio.create_task(self._spawn())
+        self._starting.add(task)
+        task.add_done_callback(lambda t: self._refilled(t, attempt))
+
+    def _refilled(self, task: asyncio.Task, attempt: int):
+        self._starting.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            self._spawn_failed(task.exception(), attempt)
+
+    def _spawn_failed(self, error: BaseException, attempt: int):
+        """Log a worker that did not start and schedule its replacement with exponential backoff."""
+        if self._closed:
+            return
+        delay = min(SPAWN_RETRY_MAX, SPAWN_RETRY_BASE * 2 ** attempt)
+        print(f"Engine worker failed to start ({error}); retrying in {delay:g}s. Worker log: {self.worker_log}",
+              file=sys.stderr)
+        handle = None
+
+        def retry():
+            self._retries.discard(handle)
+            self._refill(attempt + 1)
+
+        handle = asyncio.get_running_loop().call_later(delay, retry)
+        self._retries.add(handle)
+
+    async def _reap(self):
+        """Retire leases whose holder stopped renewing them."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(min(self.lease_ttl / 4, 60.0))
+            now = loop.time()
+            for worker_id, worker in list(self._leased.items()):
+                if worker.lease_expires <= now:
+                    print(f"Lease on engine worker {worker_id} expired; retiring it.", file=sys.stderr)
+                    await self.release(worker_id)
+
+    async def _spawn(self):
+        port = _free_port(self.host)
+        os.makedirs(os.path.dirname(os.path.abspath(self.worker_log)), exist_ok=True)
+        with open(self.worker_log, "ab") as log:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, WORKER_SCRIPT,
+                "--transport", "streamable-http", "--host", self.host, "--port", str(port),
+                "--player-root", self.player_root, "--warm",
+                stdout=asyncio.subprocess.DEVNULL, stderr=log,
+            )
+        worker = EngineWorker(next(self._ids), self.host, port, process)
+        try:
+            await self._wait_ready(worker)
+        except Exception:
+            await self._stop(worker)
+            raise
+        await self._idle.put(worker)
+
+    async def _wait_ready(self, worker: EngineWorker):
+        deadline = asyncio.get_running_loop().time() + WORKER_START_TIMEOUT
+        while True:
+            if not worker.alive:
+                raise RuntimeError(f"Engine worker {worker.id} exited during startup (code {worker.process.returncode}).")
+            try:
+                _, writer = await asyncio.open_connection(worker.host, worker.port)
+                writer.close()
+                await writer.wait_closed()
+                return
+            except OSError:
+                if asyncio.get_running_loop().time() > deadline:
+                    raise RuntimeError(f"Engine worker {worker.id} did not start within {WORKER_START_TIMEOUT:.0f}s.")
+                await asyncio.sleep(0.05)
+
+    async def _stop(self, worker: EngineWorker):
+        if worker.alive:
+            worker.process.terminate()
+            try:
+                await asyncio.wait_for(worker.process.wait(), timeout=5)
+            except asyncio.TimeoutError:
+                worker.process.kill()
+                await worker.process.wait()
+
+
+def create_app(pool: EnginePool):
+    """Lease service: POST /lease -> {"id", "url", "ttl"}, POST /renew/{id}, POST /release/{id}, GET /status."""
+    from contextlib import asynccontextmanager
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+
+    async def lease(request):
+        try:
+            worker = await pool.acquire()
+        except PoolExhausted as e:
+            return JSONResponse({"error": str(e)}, status_code=503)
+        return JSONResponse({"id": worker.id, "url": worker.url, "ttl": pool.lease_ttl})
+
+    async def renew(request):
+        renewed = pool.renew(int(request.path_params["worker_id"]))
+        return JSONResponse({"success": renewed}, status_code=200 if renewed else 404)
+
+    async def release(request):
+        released = await pool.release(int(request.path_params["worker_id"]))
+        return JSONResponse({"success": released}, status_code=200 if released else 404)
+
+    async def status(request):
+        return JSONResponse(pool.status())
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await pool.start()
+        try:
+            yield
+        finally:
+            await pool.close()
+
+    return Starlette(
+        routes=[
+            Route("/lease", lease, methods=["POST"]),
+            Route("/renew/{worker_id:int}", renew, methods=["POST"]),
+            Route("/release/{worker_id:int}", release, methods=["POST"]),
+            Route("/status", status, methods=["GET"]),
+        ],
+        lifespan=lifespan,
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Warm pool of dice_server.py workers")
+    parser.add_argument("--size", type=int, default=2, help="Number of idle warm workers to keep ready")
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address for the lease service and workers")
+    parser.add_argument("--port", type=int, default=8099, help="Port for the lease service")
+    parser.add_argument("--player-root", default="output", help="Directory workers may load .player files from")
+    parser.add_argument("--lease-ttl", type=float, default=LEASE_TTL, metavar="SECONDS",
+                        help="Retire a leased worker whose client has not renewed it for this long")
+    parser.add_argument("--acquire-timeout", type=float, default=ACQUIRE_TIMEOUT, metavar="SECONDS",
+                        help="How long /lease waits for a free worker before answering 503")
+    parser.add_argument("--worker-log", default=None,
+                        help="File worker stderr is appended to (default: <player-root>/engine_pool_workers.log)")
+    args = parser.parse_args()
+
+    app = create_app(EnginePool(size=args.size, host=args.host, player_root=args.player_root,
+                                lease_ttl=args.lease_ttl, acquire_timeout=args.acquire_timeout,
+                                worker_log=args.worker_log))
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -2,6 +2,7 @@ import os
 import sys
 import json
 import asyncio
+import httpx
 from rich.console import Console
 from rich.panel import Panel
 from rich.padding import Padding
@@ -9,11 +10,17 @@ from prompt_toolkit import PromptSession
 from prompt_toolkit.formatted_text import HTML
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
 from display import format_stats, render_gm_text, render_image
 
 LOCK_FILE = "GameMaster_MCP.md"
 OUTPUT_DIR = "output"
 TIMELINE_INTERVAL = 5  # rounds between timeline snapshots
+ENGINE_ONLY_TOOLS = {"save_player", "open_session"}  # called by slash commands, never offered to the GM
+IMAGE_SHEET_FIELDS = [
+    "name", "gender", "race", "character_class", "level", "current_hit_points",
+    "total_hit_points", "stats", "background", "alignment",
+]
 
 TIMELINE_PROMPT = """SYSTEM INSTRUCTION: You have just completed several rounds of gameplay.
 Write a session timeline entry in the following EXACT format. Replace bracketed
@@ -84,8 +91,20 @@ async def select_wwf(input_session):
         return os.path.join(OUTPUT_DIR, files[0])
 
 
+async def _keep_lease(pool_url, worker_id, interval):
+    """Renew a pool lease until cancelled, so the pool does not reap the worker mid-game."""
+    async with httpx.AsyncClient() as http:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await http.post(f"{pool_url}/renew/{worker_id}", timeout=10)
+            except httpx.HTTPError:
+                pass
+
+
 async def run_game(chat_fn, model, context_window, verbose=False, debug=False,
-                   image_gen_fn=None, image_frequency=0):
+                   image_gen_fn=None, image_frequency=0, session_db=True, server_url=None,
+                   pool_url=None):
     """
     Run the game loop.
 
@@ -103,6 +122,12 @@ async def run_game(chat_fn, model, context_window, verbose=False, debug=False,
 
     Where each tool_calls entry is:
         {'function': {'name': str, 'arguments': dict}}
+
+    By default a private dice_server.py is spawned over stdio. Pass server_url
+    (e.g. "http://127.0.0.1:8000/mcp") to play on a shared engine started with
+    `dice_server.py --transport streamable-http` instead, or pool_url
+    (e.g. "http://127.0.0.1:8099") to lease a pre-warmed worker from
+    engine_pool.py for the length of the game.
     """
     global VERBOSE, DEBUG
     VERBOSE = verbose
@@ -126,17 +151,41 @@ async def run_game(chat_fn, model, context_window, verbose=False, debug=False,
     with open(wwf_path, "r", encoding="utf-8") as f:
         key_content = f.read()
 
+    leased_worker = None
+    lease_keeper = None
     try:
-        async with stdio_client(StdioServerParameters(
-            command=sys.executable,
-            args=["dice_server.py", player_path],
-        )) as (read, write):
+        if pool_url:
+            async with httpx.AsyncClient() as http:
+                response = await http.post(f"{pool_url}/lease", timeout=60)
+                response.raise_for_status()
+                leased_worker = response.json()
+            server_url = leased_worker["url"]
+            if leased_worker.get("ttl"):
+                lease_keeper = asyncio.create_task(_keep_lease(pool_url, leased_worker["id"], leased_worker["ttl"] / 3))
+        if server_url:
+            transport = streamablehttp_client(server_url)
+        else:
+            transport = stdio_client(StdioServerParameters(
+                command=sys.executable,
+                args=["dice_server.py", player_path] + (["--session-db"] if session_db else [])
+                + (["--response-profile", "verbose"] if DEBUG else []),
+            ))
+        async with transport as streams:
+            read, write = streams[0], streams[1]
             async with ClientSession(read, write) as session:
                 await session.initialize()
 
+                if server_url:
+                    opened = await session.call_tool("open_session", {"player_file": player_path, "session_db": session_db})
+                    opened_text = "\n".join(block.text for block in opened.content if hasattr(block, "text"))
+                    if not json.loads(opened_text).get("success"):
+                        raise RuntimeError(f"Engine server refused the session: {opened_text}")
+
                 mcp_tools = await session.list_tools()
                 tools_schema = []
                 for tool in mcp_tools.tools:
+                    if tool.name in ENGINE_ONLY_TOOLS:
+                        continue
                     tools_schema.append({
                         "type": "function",
                         "function": {
@@ -275,11 +324,29 @@ Refer to them when the player asks about past events. Do not replay or re-descri
 
                         return content
 
+                player_sheet = {}
+
+                async def fetch_player_sheet():
+                    """Return the current player sheet, pulling only the keys changed since the last fetch."""
+                    args = {"since_version": player_sheet["_version"]} if "_version" in player_sheet else {}
+                    result = await session.call_tool("dump_player_db", arguments=args)
+                    text = "\n".join(block.text for block in result.content if hasattr(block, "text"))
+                    db_data = json.loads(text)
+                    if not isinstance(db_data, dict) or "error" in db_data:
+                        raise ValueError(f"dump_player_db failed: {text}")
+                    if "_since_version" not in db_data:
+                        player_sheet.clear()
+                    for key in db_data.pop("_removed", []):
+                        player_sheet.pop(key, None)
+                    db_data.pop("_since_version", None)
+                    player_sheet.update(db_data)
+                    return dict(player_sheet)
+
                 async def _auto_generate_image(narrative_text):
                     if not narrative_text:
                         return
                     try:
-                        result = await session.call_tool("dump_player_db", {})
+                        result = await session.call_tool("dump_player_db", {"fields": IMAGE_SHEET_FIELDS})
                         db_text = "\n".join(block.text for block in result.content if hasattr(block, "text"))
                         db_data = json.loads(db_text)
                     except Exception:
@@ -289,8 +356,8 @@ Refer to them when the player asks about past events. Do not replay or re-descri
                     race = db_data.get("race", "")
                     cls = db_data.get("character_class", "")
                     level = db_data.get("level", "")
-                    hp = db_data.get("hit_points", "unknown")
-                    max_hp = db_data.get("max_hp", "unknown")
+                    hp = db_data.get("current_hit_points", "unknown")
+                    max_hp = db_data.get("total_hit_points", "unknown")
                     stats = db_data.get("stats", {})
                     bg = db_data.get("background", "")
                     alignment = db_data.get("alignment", "")
@@ -332,18 +399,13 @@ Refer to them when the player asks about past events. Do not replay or re-descri
                         )
                         console.print(Panel(help_text, title="[bold magenta]Help[/bold magenta]", border_style="magenta", expand=False))
                     elif cmd == '/stats':
-                        result = await session.call_tool("dump_player_db", arguments={})
-                        if hasattr(result, 'content') and result.content:
-                            text = "\n".join(block.text for block in result.content if hasattr(block, "text"))
-                            try:
-                                db_data = json.loads(text)
-                            except (json.JSONDecodeError, TypeError):
-                                db_data = text
-                            if isinstance(db_data, dict):
-                                for panel in format_stats(db_data):
-                                    console.print(panel)
-                            else:
-                                console.print(Panel(str(db_data), title="[bold green]Player Stats[/bold green]", border_style="green", expand=False))
+                        try:
+                            db_data = await fetch_player_sheet()
+                        except Exception:
+                            db_data = None
+                        if db_data:
+                            for panel in format_stats(db_data):
+                                console.print(panel)
                         else:
                             console.print("[yellow]Could not retrieve player stats.[/yellow]")
                     elif cmd == '/sync':
@@ -351,45 +413,22 @@ Refer to them when the player asks about past events. Do not replay or re-descri
                         await chat_with_tools("{{_SYNC_DATABASE}}")
                         console.print(Panel("[green]Database synchronized.[/green]", border_style="green", expand=False))
                     elif cmd == '/save':
-                        result = await session.call_tool("dump_player_db", arguments={})
+                        result = await session.call_tool("save_player", arguments={})
+                        save_data = {}
                         if hasattr(result, 'content') and result.content:
                             text = "\n".join(block.text for block in result.content if hasattr(block, "text"))
                             try:
-                                db_data = json.loads(text)
+                                save_data = json.loads(text)
                             except (json.JSONDecodeError, TypeError):
-                                db_data = {}
-                            buff_data = db_data.get("_active_buff_data", {})
-                            if isinstance(buff_data, str):
-                                try:
-                                    buff_data = json.loads(buff_data)
-                                except (json.JSONDecodeError, TypeError):
-                                    buff_data = {}
-                            cleared = []
-                            for spell_name, entries in buff_data.items():
-                                for entry in entries:
-                                    field = entry["field"]
-                                    delta = entry["delta"]
-                                    if field == "temporary_hit_points":
-                                        db_data[field] = 0
-                                    else:
-                                        current_val = db_data.get(field, 0)
-                                        if isinstance(current_val, str):
-                                            try:
-                                                current_val = int(current_val)
-                                            except (ValueError, TypeError):
-                                                continue
-                                        db_data[field] = current_val - delta
-                                cleared.append(spell_name)
-                            db_data["active_effects"] = []
-                            db_data["_active_buff_data"] = {}
-                            with open(player_path, "w", encoding="utf-8") as f:
-                                json.dump(db_data, f, indent=2)
+                                save_data = {}
+                        if save_data.get("success"):
                             msg = f"[green]Character sheet saved to {player_path}[/green]"
+                            cleared = save_data.get("reverted_effects") or []
                             if cleared:
                                 msg += f"\n[dim]Reverted effects for save: {', '.join(cleared)}[/dim]"
                             console.print(Panel(msg, border_style="green", expand=False))
                         else:
-                            console.print("[red]Save failed — could not read database.[/red]")
+                            console.print(f"[red]Save failed — {save_data.get('error', 'could not read database.')}[/red]")
                     elif cmd == '/quit':
                         return 'quit'
                     else:
@@ -512,4 +551,13 @@ Refer to them when the player asks about past events. Do not replay or re-descri
         import traceback
         traceback.print_exc()
         console.print(f"\n[bold red]Fatal error: {e}[/bold red]")
-        console.print("[dim]The game session has ended unexpectedly.[/dim]")
\ No newline at end of file
+        console.print("[dim]The game session has ended unexpectedly.[/dim]")
+    finally:
+        if lease_keeper:
+            lease_keeper.cancel()
+        if leased_worker:
+            try:
+                async with httpx.AsyncClient() as http:
+                    await http.post(f"{pool_url}/release/{leased_worker['id']}", timeout=10)
+            except httpx.HTTPError:
+                pass